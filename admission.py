@@ -0,0 +1,123 @@
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import streamlit as st
+import metrics
+
+class AdmissionRejected(Exception):
+    """Raised when an LLM call is not admitted"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason  # "rate_limited", "queue_full" or "timeout"
+
+class TokenBucket:
+    """Allows bursts of `capacity` calls, refilled at `rate` calls per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class AdmissionController:
+    """Global concurrency cap, per-user token buckets and a bounded wait queue"""
+
+    def __init__(self, max_concurrent=8, max_queue=32, max_wait=10.0, user_rate=0.2, user_burst=5):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._buckets = {}  # user_id -> TokenBucket
+        self._wait_times = deque(maxlen=1000)  # seconds, most recent admitted calls
+        self.counters = {'admitted': 0, 'rate_limited': 0, 'queue_full': 0, 'timeout': 0}
+
+    @contextmanager
+    def admit(self, user_id):
+        """Hold one LLM slot for the duration of the block.
+
+        Background calls pass user_id=None to skip the per-user rate limit.
+        """
+        self._acquire(user_id)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+    def _bucket(self, user_id):
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            # Buckets of idle users are full again, so they can be dropped
+            if len(self._buckets) > 10000:
+                idle = time.monotonic() - self.user_burst / self.user_rate
+                self._buckets = {uid: b for uid, b in self._buckets.items() if b.updated > idle}
+            bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def _acquire(self, user_id):
+        started = time.monotonic()
+        with self._cond:
+            if user_id is not None and not self._bucket(user_id).take():
+                self.counters['rate_limited'] += 1
+                raise AdmissionRejected("rate_limited")
+
+            if self._active >= self.max_concurrent or self._waiting:
+                if self._waiting >= self.max_queue:
+                    self.counters['queue_full'] += 1
+                    raise AdmissionRejected("queue_full")
+                deadline = started + self.max_wait
+                self._waiting += 1
+                try:
+                    while self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.counters['timeout'] += 1
+                            raise AdmissionRejected("timeout")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._active += 1
+            self.counters['admitted'] += 1
+            self._wait_times.append(time.monotonic() - started)
+
+    def stats(self):
+        """Current queue depth, active calls, counters and recent wait times"""
+        with self._cond:
+            waits = sorted(self._wait_times)
+            result = dict(self.counters)
+            result.update({
+                'active': self._active,
+                'queue_depth': self._waiting,
+                'wait_p50': statistics.median(waits) if waits else 0.0,
+                'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                'wait_max': waits[-1] if waits else 0.0
+            })
+            return result
+
+# Process-wide admission control for Gemini calls
+admission = AdmissionController(
+    max_concurrent=int(st.secrets.get("LLM_MAX_CONCURRENT", 8)),
+    max_queue=int(st.secrets.get("LLM_MAX_QUEUE", 32)),
+    max_wait=float(st.secrets.get("LLM_MAX_WAIT", 10)),
+    user_rate=float(st.secrets.get("LLM_USER_RATE", 0.2)),
+    user_burst=int(st.secrets.get("LLM_USER_BURST", 5))
+)
+metrics.register_collector("llm_admission", admission.stats)
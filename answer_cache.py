@@ -0,0 +1,183 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+import metrics
+from database import get_shared_answer, save_shared_answer, on_catalog_change, record_llm_usage
+from admission import admission
+from assistant import get_model, course_context, with_course_context, generate_with_retries
+
+# Example questions shown in the chat sidebar
+EXAMPLE_QUESTIONS = [
+    "Hi! Can you help me with course information?",
+    "What courses do you offer?",
+    "Tell me about B.Tech program",
+    "What is the fee structure for BCA?",
+    "What subjects are taught in B.Sc first semester?",
+    "How long is the B.Tech program?",
+    "What are the subjects in BCA?",
+    "Tell me about admission process",
+    "What is the duration of B.Sc?",
+    "Can you compare B.Tech and BCA programs?"
+]
+
+# Max number of example answers generated at the same time
+WARMUP_WORKERS = 3
+
+def normalize_question(question):
+    """Normalize a question so trivial variants share a cache key"""
+    question = question.lower()
+    question = re.sub(r"[^\w\s]", "", question)
+    return " ".join(question.split())
+
+class AnswerCache:
+    """LRU + TTL cache of answers keyed by normalized question and catalog version"""
+
+    def __init__(self, max_entries=1000, ttl=3600, shared=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (catalog_version, question) -> (answer, stored_at)
+        self._catalog_version = None
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def _check_version(self, catalog_version):
+        """Move the cache forward to a newer catalog; False for an older one"""
+        if self._catalog_version is not None and catalog_version < self._catalog_version:
+            # A request or warm-up that started before a catalog update
+            return False
+        if catalog_version != self._catalog_version:
+            # Answers for an older catalog can never match again, so drop them
+            self._entries.clear()
+            self._catalog_version = catalog_version
+        return True
+
+    def get(self, question, catalog_version):
+        """Get a cached answer, or None on a miss"""
+        key = (catalog_version, normalize_question(question))
+        with self._lock:
+            if not self._check_version(catalog_version):
+                self.stats['misses'] += 1
+                return None
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            self._entries.pop(key, None)
+
+        if self.shared:
+            answer = get_shared_answer(key[1], catalog_version, self.ttl)
+            if answer is not None:
+                with self._lock:
+                    if self._check_version(catalog_version):
+                        self._store(key, answer)
+                    self.stats['shared_hits'] += 1
+                return answer
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, question, catalog_version, answer):
+        """Cache an answer for a question"""
+        key = (catalog_version, normalize_question(question))
+        with self._lock:
+            if not self._check_version(catalog_version):
+                return
+            self._store(key, answer)
+        if self.shared:
+            save_shared_answer(key[1], catalog_version, answer)
+
+    def _store(self, key, answer):
+        self._entries[key] = (answer, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all locally cached answers"""
+        with self._lock:
+            self._entries.clear()
+
+# Process-wide answer cache shared by all sessions
+answer_cache = AnswerCache(
+    max_entries=int(st.secrets.get("ANSWER_CACHE_SIZE", 1000)),
+    ttl=int(st.secrets.get("ANSWER_CACHE_TTL", 3600)),
+    shared=bool(st.secrets.get("ANSWER_CACHE_SHARED", False))
+)
+metrics.register_collector("answer_cache", lambda: answer_cache.stats)
+
+# Precomputed example answers as (catalog_version, {normalized question: answer}).
+# Replaced as a whole once a warm-up finishes so readers never see a partial set.
+_precomputed = (None, {})
+_warmup_lock = threading.Lock()
+_warming_version = None
+
+def get_precomputed_answer(question, catalog_version):
+    """Get the precomputed answer to an example question, if ready"""
+    version, answers = _precomputed
+    if version != catalog_version:
+        return None
+    return answers.get(normalize_question(question))
+
+def warm_up_answers(catalog_version, courses):
+    """Start generating example answers for a catalog version in the background"""
+    global _warming_version
+    with _warmup_lock:
+        if catalog_version in (_precomputed[0], _warming_version):
+            return
+        _warming_version = catalog_version
+    threading.Thread(
+        target=_run_warm_up,
+        args=(catalog_version, courses),
+        daemon=True
+    ).start()
+
+def _generate_answer(model, question, catalog_version, courses):
+    if answer_cache.shared:
+        # Another process may already have answered it for this catalog
+        answer = get_shared_answer(normalize_question(question), catalog_version, answer_cache.ttl)
+        if answer is not None:
+            return answer
+    try:
+        context = course_context(question, catalog_version, courses)
+        usage = {}
+        # Warm-up shares the LLM slots with answers, but has no per-user limit
+        with admission.admit(None):
+            answer = "".join(generate_with_retries(
+                model, with_course_context(question, context), usage=usage, purpose="warmup"
+            ))
+        record_llm_usage("warmup", usage)
+        return answer
+    except Exception as e:
+        print(f"Error precomputing answer for {question!r}: {str(e)}")
+        return None
+
+def _run_warm_up(catalog_version, courses):
+    global _precomputed, _warming_version
+    model = get_model(catalog_version, courses)
+    with ThreadPoolExecutor(max_workers=WARMUP_WORKERS) as pool:
+        answers = list(pool.map(
+            lambda question: _generate_answer(model, question, catalog_version, courses),
+            EXAMPLE_QUESTIONS
+        ))
+
+    precomputed = {}
+    for question, answer in zip(EXAMPLE_QUESTIONS, answers):
+        if answer:
+            precomputed[normalize_question(question)] = answer
+            answer_cache.put(question, catalog_version, answer)
+
+    with _warmup_lock:
+        # Don't replace answers for a newer catalog that finished first
+        if _warming_version == catalog_version:
+            if precomputed:
+                _precomputed = (catalog_version, precomputed)
+            # With nothing generated, a later rerun starts the warm-up again
+            _warming_version = None
+
+on_catalog_change(warm_up_answers)
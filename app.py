@@ -1,92 +1,177 @@
 import streamlit as st
-import google.generativeai as genai
-import json
 from datetime import datetime
 import pytz
-from database import init_database, get_course_data, save_chat, get_or_create_user_session
-
-# Must be the first Streamlit command
-st.set_page_config(
-    page_title="University Course Assistant",
-    page_icon="🎓",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# Initialize database and get user session
-init_database()
-user_id = get_or_create_user_session()
-
-# Configure Gemini AI
-GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
-genai.configure(api_key=GOOGLE_API_KEY)
-
-# Initialize Gemini model
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-# Get course data from database
-data = {"courses": get_course_data()}
-
-# Create a context for the AI
-context = f"""
-You are a helpful university admission counselor chatbot. You have information about the following courses:
-
-{json.dumps(data, indent=2)}
-
-Key points to remember:
-1. Always be polite and professional
-2. Provide accurate information about courses based on the data provided
-3. Handle general queries and greetings naturally
-4. If asked about information not in the data, politely say you can only provide information about the listed courses
-5. Keep responses concise but informative
-6. Use appropriate emojis to make responses engaging
-7. Format responses using markdown for better readability
-
-Example interactions:
-- Greet users warmly
-- Answer questions about course duration, fees, and subjects
-- Provide guidance on admission process
-- Handle small talk naturally
-- Stay focused on academic and admission related queries
-"""
+from database import init_database, get_course_data, get_catalog_version, save_chat, get_or_create_user_session, get_token_spend, record_llm_usage
+from assistant import get_model, summarize_turns, course_context, with_course_context, generate_with_retries
+from memory import ConversationMemory
+from fast_path import answer_from_catalog, fallback_answer
+from admission import admission, AdmissionRejected
+from answer_cache import answer_cache, get_precomputed_answer, warm_up_answers, EXAMPLE_QUESTIONS
+import metrics
+
+# Time the whole rerun and count its MongoDB commands, including reruns
+# cut short by st.rerun, st.stop or an exception
+with metrics.rerun("chat"):
+    # Must be the first Streamlit command
+    st.set_page_config(
+        page_title="University Course Assistant",
+        page_icon="🎓",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+    # Initialize database and get user session
+    with metrics.span("init_database"):
+        init_database()
+    with metrics.span("user_session"):
+        user_id = get_or_create_user_session()
+
+    with metrics.span("course_data"):
+        # Get the model compiled for the current course catalog
+        catalog_version = get_catalog_version()
+        model = get_model(catalog_version, get_course_data())
+
+        # Make sure this worker has answers for the sidebar questions of this catalog
+        warm_up_answers(catalog_version, get_course_data())
+
+    # Initialize chat history in session state
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = []  # This will store (user_msg, bot_msg, timestamp) tuples
+    if 'current_question' not in st.session_state:
+        st.session_state.current_question = ""
+
+    # Number of messages shown at first, and added by each "Show older messages" click
+    TRANSCRIPT_PAGE_SIZE = int(st.secrets.get("TRANSCRIPT_PAGE_SIZE", 20))
+    if 'transcript_window' not in st.session_state:
+        st.session_state.transcript_window = TRANSCRIPT_PAGE_SIZE
+    if 'transcript_html' not in st.session_state:
+        st.session_state.transcript_html = []  # rendered HTML of each finished message, by index
+
+    # Stream responses chunk by chunk as Gemini generates them
+    STREAM_RESPONSES = bool(st.secrets.get("STREAM_RESPONSES", True))
+
+    # Minimum confidence for answering straight from the catalog without Gemini
+    FAST_PATH_THRESHOLD = float(st.secrets.get("FAST_PATH_THRESHOLD", 0.8))
+
+    # Daily Gemini token budgets (input + output, IST days); 0 means no limit
+    USER_DAILY_TOKEN_BUDGET = int(st.secrets.get("USER_DAILY_TOKEN_BUDGET", 0))
+    DAILY_TOKEN_BUDGET = int(st.secrets.get("DAILY_TOKEN_BUDGET", 0))
+
+    # Replies shown when a Gemini call is not admitted
+    BUSY_MESSAGES = {
+        'rate_limited': "⏳ You're sending messages a little too quickly. Please wait a moment and try again.",
+        'queue_full': "🚦 I'm helping a lot of students right now. Please try again in a few seconds.",
+        'timeout': "🚦 I'm helping a lot of students right now. Please try again in a few seconds.",
+        'user_budget': "📊 You've reached today's limit for detailed answers. Questions about course fees, duration and subjects still work, and the limit resets at midnight (IST).",
+        'daily_budget': "📊 Detailed answers are paused for today. Questions about course fees, duration and subjects still work, and answers resume at midnight (IST)."
+    }
+
+    def token_budget_exceeded():
+        """Get the daily token budget this user has used up, if any"""
+        if not USER_DAILY_TOKEN_BUDGET and not DAILY_TOKEN_BUDGET:
+            return None
+        spend = get_token_spend(user_id)
+        if USER_DAILY_TOKEN_BUDGET and spend['user'] >= USER_DAILY_TOKEN_BUDGET:
+            return 'user_budget'
+        if DAILY_TOKEN_BUDGET and spend['total'] >= DAILY_TOKEN_BUDGET:
+            return 'daily_budget'
+        return None
 
-# Initialize chat history in session state
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []  # This will store (user_msg, bot_msg, timestamp) tuples
-if 'current_question' not in st.session_state:
-    st.session_state.current_question = ""
-if 'chat' not in st.session_state:
-    st.session_state.chat = model.start_chat(history=[])
-
-def get_ai_response(user_input):
-    try:
-        prompt = f"Context: {context}\n\nUser: {user_input}\n\nResponse:"
-        response = st.session_state.chat.send_message(prompt)
-        save_chat(user_input, response.text)
-        return response.text
-    except Exception as e:
-        st.error("An error occurred while getting a response from the AI. Please try again.")
-        return f"I apologize, but I encountered an error: {str(e)}"
-
-# Example questions
-example_questions = [
-    "Hi! Can you help me with course information?",
-    "What courses do you offer?",
-    "Tell me about B.Tech program",
-    "What is the fee structure for BCA?",
-    "What subjects are taught in B.Sc first semester?",
-    "How long is the B.Tech program?",
-    "What are the subjects in BCA?",
-    "Tell me about admission process",
-    "What is the duration of B.Sc?",
-    "Can you compare B.Tech and BCA programs?"
-]
-
-def set_question(question):
-    st.session_state.current_question = question
-
-# Custom CSS with improved sidebar styling
-st.markdown("""
+    def summarize_for_user(summary, turns, max_tokens):
+        """Summarize older turns through the same admission control and budgets as answers"""
+        exceeded = token_budget_exceeded()
+        if exceeded:
+            raise AdmissionRejected(exceeded)
+        usage = {}
+        with admission.admit(user_id):
+            result = summarize_turns(summary, turns, max_tokens, usage=usage)
+        record_llm_usage("summary", usage)
+        return result
+
+    if 'memory' not in st.session_state:
+        st.session_state.memory = ConversationMemory(
+            token_budget=int(st.secrets.get("MEMORY_TOKEN_BUDGET", 2000)),
+            keep_turns=int(st.secrets.get("MEMORY_KEEP_TURNS", 4)),
+            summarize=summarize_for_user
+        )
+
+    def get_ai_response(user_input):
+        """Yield the AI response in chunks and save the chat once it is complete"""
+        try:
+            memory = st.session_state.memory
+
+            # Only answers that don't depend on earlier turns are safe to reuse, so
+            # the answer cache is only read and written for opening questions
+            standalone = not memory.turns and not memory.summary
+
+            # Serve fact questions, sidebar questions and repeated questions without calling Gemini
+            with metrics.span("answer_lookup"):
+                cached_answer = answer_from_catalog(user_input, catalog_version, get_course_data(), FAST_PATH_THRESHOLD)
+                if cached_answer is None:
+                    cached_answer = get_precomputed_answer(user_input, catalog_version)
+                if cached_answer is None and standalone:
+                    cached_answer = answer_cache.get(user_input, catalog_version)
+            if cached_answer is not None:
+                memory.add_turn(user_input, cached_answer, background=True)
+                with metrics.span("save_chat"):
+                    save_chat(user_input, cached_answer)
+                yield cached_answer
+                return
+
+            # Enforce the token budgets before calling Gemini
+            with metrics.span("token_budget"):
+                exceeded = token_budget_exceeded()
+            if exceeded:
+                metrics.inc("llm_budget_rejections_total", budget=exceeded)
+                raise AdmissionRejected(exceeded)
+
+            # Send only the courses relevant to this question (and the previous one,
+            # for follow-ups); memory keeps the plain message
+            context = course_context(
+                f"{memory.last_user_message()} {user_input}",
+                catalog_version,
+                get_course_data()
+            )
+            contents = memory.build_contents(with_course_context(user_input, context))
+
+            chunks = []
+            usage = {}
+            try:
+                with metrics.span("llm"), admission.admit(user_id):
+                    for text in generate_with_retries(model, contents, stream=STREAM_RESPONSES, usage=usage):
+                        chunks.append(text)
+                        yield text
+            except AdmissionRejected:
+                raise
+            except Exception as e:
+                # Degrade to an answer from the catalog; the turn is saved as failed
+                # so it stays out of memory, the answer cache and analytics
+                print(f"Error getting a response from Gemini: {str(e)}")
+                fallback = fallback_answer(user_input, catalog_version, get_course_data())
+                if chunks:
+                    fallback = "\n\n" + fallback
+                yield fallback
+                with metrics.span("save_chat"):
+                    save_chat(user_input, "".join(chunks) + fallback, status="failed")
+                return
+            response_text = "".join(chunks)
+            memory.add_turn(user_input, response_text, background=True)
+            with metrics.span("save_chat"):
+                save_chat(user_input, response_text, usage=usage)
+            if standalone:
+                answer_cache.put(user_input, catalog_version, response_text)
+        except AdmissionRejected as e:
+            # Not a real answer, so it isn't saved or added to memory
+            yield BUSY_MESSAGES[e.reason]
+        except Exception as e:
+            st.error("An error occurred while getting a response from the AI. Please try again.")
+            yield f"I apologize, but I encountered an error: {str(e)}"
+
+    def set_question(question):
+        st.session_state.current_question = question
+
+    # Custom CSS with improved sidebar styling
+    st.markdown("""
     <style>
     .main {
         padding: 2rem;
@@ -121,6 +206,19 @@ st.markdown("""
         font-size: 0.8em;
         margin-top: 8px;
     }
+    .chat-row {
+        display: flex;
+        flex-wrap: wrap;
+        gap: 1rem;
+    }
+    .chat-row .user-column {
+        flex: 6 1 300px;
+        min-width: 0;
+    }
+    .chat-row .bot-column {
+        flex: 4 1 300px;
+        min-width: 0;
+    }
     .example-question {
         background-color: #f8f9fa;
         padding: 8px 12px;
@@ -163,35 +261,35 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Sidebar with improved styling
-with st.sidebar:
-    st.image("./Resources/Logo.png", use_container_width=True)
-    
-    # Welcome Section
-    st.markdown("""
+    # Sidebar with improved styling
+    with st.sidebar:
+        st.image("./Resources/Logo.png", use_container_width=True)
+
+        # Welcome Section
+        st.markdown("""
         <div class="sidebar-section">
             <div class="sidebar-header">👋 Welcome!</div>
             <p>I'm here to help you explore our academic programs and answer your questions about admissions.</p>
         </div>
     """, unsafe_allow_html=True)
-    
-    # Example Questions Section
-    st.markdown("""
+
+        # Example Questions Section
+        st.markdown("""
         <div class="sidebar-section">
             <div class="sidebar-header">💭 Example Questions</div>
     """, unsafe_allow_html=True)
-    
-    for question in example_questions:
-        if st.button(f"🔹 {question}", key=f"btn_{question}", 
-                    help="Click to ask this question",
-                    use_container_width=True):
-            set_question(question)
-            st.rerun()
-    
-    st.markdown("</div>", unsafe_allow_html=True)
-    
-    # Quick Links Section
-    st.markdown("""
+
+        for question in EXAMPLE_QUESTIONS:
+            if st.button(f"🔹 {question}", key=f"btn_{question}", 
+                        help="Click to ask this question",
+                        use_container_width=True):
+                set_question(question)
+                st.rerun()
+
+        st.markdown("</div>", unsafe_allow_html=True)
+
+        # Quick Links Section
+        st.markdown("""
         <div class="sidebar-section">
             <div class="sidebar-header">🔗 Quick Links</div>
             <a href="#" class="sidebar-link">📚 University Website</a>
@@ -199,9 +297,9 @@ with st.sidebar:
             <a href="#" class="sidebar-link">👤 Student Dashboard</a>
         </div>
     """, unsafe_allow_html=True)
-    
-    # Contact Support Section
-    st.markdown("""
+
+        # Contact Support Section
+        st.markdown("""
         <div class="sidebar-section">
             <div class="sidebar-header">📞 Contact Support</div>
             <p>📞 Helpline: 1800-XXX-XXXX</p>
@@ -209,72 +307,96 @@ with st.sidebar:
         </div>
     """, unsafe_allow_html=True)
 
-# Main chat interface
-st.title("🎓 University Course Assistant")
-st.markdown("---")
+    # Main chat interface
+    st.title("🎓 University Course Assistant")
+    st.markdown("---")
 
-# Chat container
-chat_container = st.container()
+    # Chat container
+    chat_container = st.container()
 
-# Display chat history
-for message_data in st.session_state.chat_history:
-    with chat_container:
-        col1, col2 = st.columns([6,4])
-        
+    # A blank line in an answer ends the HTML block, so the row HTML is kept flush
+    # left: indented tags after it would be rendered as code blocks
+    def bot_message_html(bot):
+        return f"""<div class="chat-message bot-message">
+<strong>Assistant:</strong>
+{bot}</div>"""
+
+    def chat_row_html(user, bot, timestamp):
+        """HTML for one exchange: the question on the left, the answer on the right"""
+        return f"""<div class="chat-row">
+<div class="user-column">
+<div class="chat-message user-message">
+<strong>You:</strong> {user}
+</div>
+<div class="timestamp">{timestamp}</div>
+</div>
+<div class="bot-column">
+{bot_message_html(bot)}
+<div class="timestamp">{timestamp}</div>
+</div>
+</div>
+"""
+
+    # Render each finished message once; later reruns reuse its HTML
+    chat_history = st.session_state.chat_history
+    transcript_html = st.session_state.transcript_html
+    for message_data in chat_history[len(transcript_html):]:
         # Handle both formats of chat history (with and without timestamp)
         if len(message_data) == 3:
             user, bot, timestamp = message_data
         else:
             user, bot = message_data
             timestamp = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%H:%M')
-            
-        with col1:
-            st.markdown(f"""
-                <div class="chat-message user-message">
-                    <strong>You:</strong> {user}
-                </div>
-            """, unsafe_allow_html=True)
-            st.caption(timestamp)
-        with col2:
-            st.markdown(f"""
-                <div class="chat-message bot-message">
-                    <strong>Assistant:</strong>
-                    {bot}</div>
-            """, unsafe_allow_html=True)
-            st.caption(timestamp)
-
-# Input container
-st.markdown("---")
-input_col1, input_col2 = st.columns([6, 1])
-with input_col1:
-    user_input = st.text_input("Ask your question here...", 
-                              value=st.session_state.current_question,
-                              key="input", 
-                              placeholder="e.g., What courses do you offer?")
-with input_col2:
-    st.text(" ")
-    send_button = st.button("Send 📤", use_container_width=True)
-
-if send_button and user_input:
-    # Get AI response
-    ai_response = get_ai_response(user_input)
-    
-    # Get current time in IST
-    current_time = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%H:%M')
-    
-    # Update chat history with timestamp
-    st.session_state.chat_history.append((user_input, ai_response, current_time))
-    
-    # Clear input
-    st.session_state.current_question = ""
-    st.rerun()
-
-# Footer
-st.markdown(
-    """
+        transcript_html.append(chat_row_html(user, bot, timestamp))
+
+    # Display only the most recent messages, each in its own element so broken
+    # markup in one message can't spill into the others
+    with chat_container:
+        hidden = len(transcript_html) - st.session_state.transcript_window
+        if hidden > 0 and st.button(f"⬆️ Show older messages ({hidden} more)", key="show_older"):
+            st.session_state.transcript_window += TRANSCRIPT_PAGE_SIZE
+            st.rerun()
+        for row_html in transcript_html[-st.session_state.transcript_window:]:
+            st.markdown(row_html, unsafe_allow_html=True)
+
+    # Input container
+    st.markdown("---")
+    input_col1, input_col2 = st.columns([6, 1])
+    with input_col1:
+        user_input = st.text_input("Ask your question here...", 
+                                  value=st.session_state.current_question,
+                                  key="input", 
+                                  placeholder="e.g., What courses do you offer?")
+    with input_col2:
+        st.text(" ")
+        send_button = st.button("Send 📤", use_container_width=True)
+
+    if send_button and user_input:
+        # Get current time in IST
+        current_time = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%H:%M')
+
+        # Show the question right away and stream the answer in below it
+        with chat_container:
+            placeholder = st.empty()
+            ai_response = ""
+            for chunk in get_ai_response(user_input):
+                ai_response += chunk
+                placeholder.markdown(chat_row_html(user_input, ai_response + " ▌", current_time), unsafe_allow_html=True)
+            placeholder.markdown(chat_row_html(user_input, ai_response, current_time), unsafe_allow_html=True)
+
+        # Update chat history with timestamp
+        st.session_state.chat_history.append((user_input, ai_response, current_time))
+
+        # Clear input
+        st.session_state.current_question = ""
+        st.rerun()
+
+    # Footer
+    st.markdown(
+        """
     <div style='text-align: center; color: gray; padding: 1rem;'>
         © 2025 Brijesh Adeshara. All rights reserved.
     </div>
     """, 
-    unsafe_allow_html=True
-)
+        unsafe_allow_html=True
+    )
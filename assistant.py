@@ -0,0 +1,165 @@
+import json
+import random
+import streamlit as st
+import threading
+import time
+import metrics
+from retrieval import search_courses
+from llm_backends import GeminiBackend, StubBackend, TransientLLMError
+
+MODEL_NAME = 'gemini-2.0-flash'
+
+# Max number of course records sent with each question
+RETRIEVAL_TOP_K = int(st.secrets.get("RETRIEVAL_TOP_K", 3))
+
+# Total time (in seconds) allowed for a Gemini request, including retries
+LLM_TIMEOUT = float(st.secrets.get("LLM_TIMEOUT", 30))
+LLM_MAX_RETRIES = int(st.secrets.get("LLM_MAX_RETRIES", 2))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 4.0
+
+# Errors worth retrying: rate limits, overload and transient network failures
+RETRYABLE_ERRORS = (TransientLLMError, ConnectionError, TimeoutError)
+
+class LLMUnavailable(Exception):
+    """Raised when the LLM gives no usable answer before the deadline"""
+
+def create_backend():
+    """Create the LLM backend selected by the LLM_BACKEND setting"""
+    backend = st.secrets.get("LLM_BACKEND", "gemini")
+    if backend == "gemini":
+        return GeminiBackend(st.secrets["GOOGLE_API_KEY"], MODEL_NAME)
+    if backend == "stub":
+        return StubBackend(**st.secrets.get("llm_stub", {}))
+    raise ValueError(f"Unknown LLM_BACKEND: {backend}")
+
+# LLM backend shared by the whole process
+backend = create_backend()
+
+# Compiled models keyed by catalog version. Only the latest version is kept,
+# so every session in the process shares one system prompt per catalog.
+_model_lock = threading.Lock()
+_models = {}
+
+def build_system_prompt(courses):
+    """Build the system instruction for a course catalog"""
+    course_names = ", ".join(courses)
+    return f"""
+You are a helpful university admission counselor chatbot. You have information about the following courses:
+
+{course_names}
+
+Details of the courses relevant to each question are provided along with the question.
+
+Key points to remember:
+1. Always be polite and professional
+2. Provide accurate information about courses based on the data provided
+3. Handle general queries and greetings naturally
+4. If asked about information not in the data, politely say you can only provide information about the listed courses
+5. Keep responses concise but informative
+6. Use appropriate emojis to make responses engaging
+7. Format responses using markdown for better readability
+
+Example interactions:
+- Greet users warmly
+- Answer questions about course duration, fees, and subjects
+- Provide guidance on admission process
+- Handle small talk naturally
+- Stay focused on academic and admission related queries
+"""
+
+def course_context(query, catalog_version, courses):
+    """Get the catalog records relevant to a query as compact JSON"""
+    names = search_courses(query, catalog_version, courses, RETRIEVAL_TOP_K)
+    if not names and len(courses) <= RETRIEVAL_TOP_K:
+        # Small catalogs fit in full when nothing specific was asked about
+        names = list(courses)
+    if not names:
+        return ""
+    relevant = {name: courses[name] for name in names}
+    # Compact encoding: no indentation or extra whitespace in the catalog JSON
+    return json.dumps({"courses": relevant}, separators=(',', ':'), ensure_ascii=False)
+
+def with_course_context(user_input, context):
+    """Attach course details to a user message"""
+    if not context:
+        return user_input
+    return f"Relevant course data: {context}\n\nUser: {user_input}"
+
+def generate_with_retries(model, contents, stream=False, timeout=None, usage=None, purpose="answer"):
+    """Yield response text chunks, retrying retryable errors until the deadline.
+
+    Raises LLMUnavailable when retries or time run out, or when a stream
+    fails after part of the answer was already yielded. If a usage dict is
+    given, the token counts of the successful attempt and the total latency
+    (latency_ms, retries included) are set in it.
+    """
+    call_started = time.perf_counter()
+    deadline = time.monotonic() + (timeout or LLM_TIMEOUT)
+    attempt = 0
+    while True:
+        started = False
+        attempt_usage = {}
+        request_started = time.perf_counter()
+        try:
+            for text in model.generate(contents, stream=stream, timeout=max(deadline - time.monotonic(), 1),
+                                       usage=attempt_usage):
+                if time.monotonic() > deadline:
+                    raise LLMUnavailable("Deadline exceeded while streaming")
+                if not started:
+                    metrics.observe("llm_first_token_seconds", time.perf_counter() - request_started, purpose=purpose)
+                started = True
+                yield text
+            metrics.observe("llm_request_seconds", time.perf_counter() - request_started, purpose=purpose)
+            metrics.inc("llm_requests_total", purpose=purpose, outcome="ok")
+            for kind in ('input', 'output'):
+                tokens = attempt_usage.get(f'{kind}_tokens') or 0
+                metrics.inc("llm_tokens_total", tokens, purpose=purpose, kind=kind)
+            if usage is not None:
+                usage.update(attempt_usage)
+                usage['latency_ms'] = round((time.perf_counter() - call_started) * 1000)
+            return
+        except RETRYABLE_ERRORS as e:
+            metrics.inc("llm_requests_total", purpose=purpose, outcome="error")
+            if started:
+                raise LLMUnavailable(f"Stream interrupted: {str(e)}") from e
+            attempt += 1
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            if attempt > LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                raise LLMUnavailable(f"Gave up after {attempt} attempts: {str(e)}") from e
+            metrics.inc("llm_retries_total", purpose=purpose)
+            time.sleep(delay)
+        except LLMUnavailable:
+            metrics.inc("llm_requests_total", purpose=purpose, outcome="deadline")
+            raise
+
+def get_model(catalog_version, courses):
+    """Get the LLM model compiled with the system prompt for a catalog version"""
+    model = _models.get(catalog_version)
+    if model is not None:
+        return model
+
+    with _model_lock:
+        model = _models.get(catalog_version)
+        if model is None:
+            model = backend.get_model(build_system_prompt(courses))
+            _models.clear()
+            _models[catalog_version] = model
+        return model
+
+def summarize_turns(summary, turns, max_tokens, usage=None):
+    """Summarize older conversation turns into a short running summary"""
+    transcript = "\n".join(f"User: {user}\nAssistant: {bot}" for user, bot in turns)
+    prompt = f"""
+Update the summary of a conversation between a student and a university admission counselor.
+Keep the courses discussed, the student's interests and any open questions.
+Answer with the summary only, in at most {max_tokens * 3 // 4} words.
+
+Current summary:
+{summary or "(none)"}
+
+New conversation turns:
+{transcript}
+"""
+    return "".join(generate_with_retries(backend.get_model(), prompt, usage=usage, purpose="summary")).strip()
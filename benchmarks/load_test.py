@@ -0,0 +1,328 @@
+"""End-to-end load and latency benchmark for the chat and admin pages.
+
+Drives simulated sessions through app.py and pages/admin.py with
+Streamlit's AppTest, against a local MongoDB (or the in-process
+mongomock fake) seeded with synthetic data, and the offline stub LLM
+backend. Reports rerun latency percentiles, MongoDB round trips per rerun
+and memory per session, and writes the results as JSON.
+
+    python benchmarks/load_test.py --sessions 20 --turns 5 --chats 100000
+    python benchmarks/load_test.py --mongo-uri mongomock:// --chats 10000
+
+mongomock (pip install mongomock; its bulk writes need pymongo < 4.9)
+only covers part of the aggregation language and reports no command
+events, so round trips are counted per collection call there; use a
+local mongod for full-fidelity numbers and for the larger scales (up to
+10M chats).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytz
+from pymongo import monitoring
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = os.path.join(ROOT, "app.py")
+ADMIN_SCRIPT = os.path.join(ROOT, "pages", "admin.py")
+
+QUESTIONS = [
+    "What is the fee structure for BCA?",
+    "Tell me about B.Tech program",
+    "Can you compare B.Tech and BCA programs?",
+    "What are the career options after B.Sc?",
+    "How do I apply for admission?",
+    "Which course is best for programming?",
+    "What subjects are taught in B.Sc first semester?",
+    "Is there a scholarship for BCA students?"
+]
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands, split by the kind of thread that sent them"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'foreground': 0, 'background': 0}
+
+    def count(self, n=1):
+        name = threading.current_thread().name
+        kind = 'background' if name in ("chat-writer", "activity-flusher") else 'foreground'
+        with self.lock:
+            self.counts[kind] += n
+
+    def started(self, event):
+        self.count()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+class CountingCollection:
+    """Counts calls on a mongomock collection, which emits no command events"""
+
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter.count()
+            return attr(*args, **kwargs)
+        return counted
+
+def serialize_script_parsing():
+    """Parse one app script at a time.
+
+    AppTest parses the script again on every run, and parsing in several
+    threads at once can fail on CPython 3.11 with "AST constructor
+    recursion depth mismatch".
+    """
+    lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def locked_get_bytecode(self, script_path):
+        with lock:
+            return get_bytecode(self, script_path)
+    ScriptCache.get_bytecode = locked_get_bytecode
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': ordered[-1] * 1000
+    }
+
+def make_secrets(args):
+    return {
+        "MONGO_URI": args.mongo_uri,
+        "MONGO_DB": args.database,
+        "LLM_BACKEND": "stub",
+        "llm_stub": {
+            "latency_ms": args.llm_latency_ms,
+            "tokens_per_second": args.llm_tokens_per_second,
+            "failure_rate": args.llm_failure_rate,
+            "seed": args.seed
+        },
+        # Simulated sessions share a handful of threads, so don't rate limit them
+        "LLM_USER_RATE": 1000,
+        "LLM_USER_BURST": 1000
+    }
+
+def new_app(script, secrets):
+    at = AppTest.from_file(script, default_timeout=120)
+    for key, value in secrets.items():
+        at.secrets[key] = value
+    return at
+
+def timed_run(at, timings):
+    started = time.perf_counter()
+    # Widgets run their AppTest and return it, so always go on with the app
+    at = at.run()
+    timings.append(time.perf_counter() - started)
+    if at.exception:
+        raise RuntimeError(f"Script raised: {at.exception}")
+    return at
+
+def seed_data(database, chats, users, batch_size=10000):
+    """Insert synthetic users and chats (with their rollups)"""
+    rng = random.Random(1)
+    ist = pytz.timezone('Asia/Kolkata')
+    now = datetime.now(ist)
+    courses = list(database.get_course_data())
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+
+    for start in range(0, users, batch_size):
+        batch = []
+        for user_id in user_ids[start:start + batch_size]:
+            created_at = datetime.now() - timedelta(seconds=rng.randint(0, 60 * 86400))
+            batch.append({
+                'user_id': user_id,
+                'created_at': created_at,
+                'last_active': created_at + timedelta(seconds=rng.randint(0, 86400)),
+                'access_count': rng.choice([1, 1, 2, 3, 8])
+            })
+        database.user_collection.insert_many(batch, ordered=False)
+
+    for start in range(0, chats, batch_size):
+        batch = []
+        for _ in range(min(batch_size, chats - start)):
+            mentioned = rng.sample(courses, rng.choice([0, 1, 1, 2])) if courses else []
+            batch.append({
+                'timestamp': now - timedelta(seconds=rng.randint(0, 60 * 86400)),
+                'user_id': rng.choice(user_ids),
+                'user_message': rng.choice(QUESTIONS),
+                'bot_response': "Synthetic answer " * rng.randint(5, 60),
+                'course_inquiry': mentioned[0] if mentioned else None,
+                'course_inquiries': mentioned,
+                'status': 'ok'
+            })
+        database.chat_collection.insert_many(batch, ordered=False)
+        database.update_chat_rollups(batch)
+
+def chat_session(secrets, turns, rng, timings):
+    """One visitor: open the page, click an example question, then type questions"""
+    at = timed_run(new_app(APP_SCRIPT, secrets), timings)
+    example = at.button(key=f"btn_{rng.choice(sys.modules['answer_cache'].EXAMPLE_QUESTIONS)}")
+    timed_run(example.click(), timings)
+    for turn in range(turns):
+        if turn:
+            at.text_input(key="input").input(rng.choice(QUESTIONS))
+        send = next(button for button in at.button if button.label == "Send 📤")
+        timed_run(send.click(), timings)
+    return at
+
+def admin_session(secrets, token, timings):
+    """One admin: overview, change the date range, chat analytics, next page"""
+    at = new_app(ADMIN_SCRIPT, secrets)
+    at.session_state['admin_session_token'] = token
+    timed_run(at, timings)
+    at.date_input(key="overview_start_date").set_value(datetime.now().date() - timedelta(days=7))
+    timed_run(at, timings)
+    at.radio[0].set_value("Chat Analytics")
+    timed_run(at, timings)
+    older = [button for button in at.button if button.label == "Older ➡️"]
+    if older:
+        timed_run(older[0].click(), timings)
+    return at
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the chat and admin pages")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="university_chatbot_bench")
+    parser.add_argument("--chats", type=int, default=10000, help="synthetic chat_history documents")
+    parser.add_argument("--users", type=int, default=None, help="synthetic users (default: chats / 10)")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=5, help="messages per chat session")
+    parser.add_argument("--admin-sessions", type=int, default=2)
+    parser.add_argument("--memory-sessions", type=int, default=5, help="sessions used to measure memory")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="results file (default: benchmarks/results/<time>.json)")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    rng = random.Random(args.seed)
+    secrets = make_secrets(args)
+
+    counter = CommandCounter()
+    monitoring.register(counter)
+    serialize_script_parsing()
+
+    # The first run imports and bootstraps the app modules, which every
+    # later session shares, like sessions in one Streamlit server process
+    if args.mongo_uri.startswith("mongodb"):
+        from pymongo import MongoClient
+        MongoClient(args.mongo_uri).drop_database(args.database)
+    timed_run(new_app(APP_SCRIPT, secrets), [])
+    database = sys.modules['database']
+    if args.mongo_uri.startswith("mongomock://"):
+        for name in ("chat_collection", "course_data_collection", "admin_collection", "user_collection",
+                     "answer_cache_collection", "meta_collection", "daily_stats_collection",
+                     "daily_users_collection", "daily_courses_collection"):
+            setattr(database, name, CountingCollection(getattr(database, name), counter))
+
+    print(f"Seeding {args.chats} chats...")
+    seed_started = time.perf_counter()
+    seed_data(database, args.chats, args.users if args.users is not None else max(args.chats // 10, 1))
+    seed_seconds = time.perf_counter() - seed_started
+    counter.counts = {'foreground': 0, 'background': 0}
+
+    # Chat sessions
+    print(f"Running {args.sessions} chat sessions x {args.turns} turns...")
+    chat_timings = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        list(pool.map(
+            lambda i: chat_session(secrets, args.turns, random.Random(rng.random()), chat_timings),
+            range(args.sessions)
+        ))
+    chat_seconds = time.perf_counter() - started
+    database.wait_for_chats()
+    database.flush_user_activity()
+    chat_counts = dict(counter.counts)
+
+    # Admin sessions
+    print(f"Running {args.admin_sessions} admin sessions...")
+    counter.counts = {'foreground': 0, 'background': 0}
+    token = database.verify_admin("admin", "admin123")
+    admin_timings = []
+    with ThreadPoolExecutor(max_workers=max(args.admin_sessions, 1)) as pool:
+        list(pool.map(lambda i: admin_session(secrets, token, admin_timings), range(args.admin_sessions)))
+    admin_counts = dict(counter.counts)
+
+    # Memory per chat session, measured separately as tracing slows everything down
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    apps = [chat_session(secrets, args.turns, random.Random(i), []) for i in range(args.memory_sessions)]
+    memory_per_session = (tracemalloc.get_traced_memory()[0] - baseline) / max(len(apps), 1)
+    tracemalloc.stop()
+
+    chat_reruns = max(len(chat_timings), 1)
+    admin_reruns = max(len(admin_timings), 1)
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'config': vars(args),
+        'seed_seconds': seed_seconds,
+        'chat': {
+            'rerun_latency': percentiles(chat_timings),
+            'wall_seconds': chat_seconds,
+            'mongo_round_trips_per_rerun': chat_counts['foreground'] / chat_reruns,
+            'mongo_background_ops_per_rerun': chat_counts['background'] / chat_reruns
+        },
+        'admin': {
+            'rerun_latency': percentiles(admin_timings),
+            'mongo_round_trips_per_rerun': admin_counts['foreground'] / admin_reruns
+        },
+        'memory_per_session_bytes': memory_per_session,
+        'llm': sys.modules['admission'].admission.stats(),
+        'answer_cache': dict(sys.modules['answer_cache'].answer_cache.stats),
+        'fast_path': dict(sys.modules['fast_path'].stats)
+    }
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+
+    for page in ('chat', 'admin'):
+        latency = results[page]['rerun_latency']
+        if latency:
+            print(f"{page:>5}: p50 {latency['p50_ms']:.0f} ms, p95 {latency['p95_ms']:.0f} ms, "
+                  f"p99 {latency['p99_ms']:.0f} ms, "
+                  f"{results[page]['mongo_round_trips_per_rerun']:.1f} Mongo round trips/rerun")
+    print(f"memory per chat session: {memory_per_session / 1024:.0f} KiB")
+    print(f"results written to {output}")
+
+if __name__ == "__main__":
+    main()
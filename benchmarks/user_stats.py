@@ -0,0 +1,107 @@
+"""Benchmark get_user_stats() against the previous seven-query version.
+
+Seeds a synthetic users collection and times both implementations. Run
+from the project root against a MongoDB you can write to:
+
+    python benchmarks/user_stats.py --mongo-uri mongodb://localhost:27017 --users 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+def seed_users(collection, count, batch_size=10000):
+    """Replace the collection with count synthetic users from the last 60 days"""
+    collection.drop()
+    now = datetime.now()
+    batch = []
+    for i in range(count):
+        created_at = now - timedelta(seconds=random.randint(0, 60 * 86400))
+        last_active = created_at + timedelta(seconds=random.randint(0, int((now - created_at).total_seconds())))
+        batch.append({
+            'user_id': f"bench-{i}",
+            'created_at': created_at,
+            'last_active': last_active,
+            'access_count': random.choice([1, 1, 1, 2, 3, 5, 10])
+        })
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    for _, keys, options in database.INDEXES['users']:
+        collection.create_index(keys, **options)
+
+def legacy_user_stats(collection):
+    """The previous implementation: six count_documents calls and one aggregation"""
+    now = datetime.now(database.pytz.timezone('Asia/Kolkata'))
+    today_start = datetime.combine(now.date(), datetime.min.time())
+    week_start = today_start - timedelta(days=7)
+    month_start = today_start - timedelta(days=30)
+    stats = {
+        'total_users': collection.count_documents({}),
+        'active_today': collection.count_documents({'last_active': {'$gte': today_start}}),
+        'new_users_today': collection.count_documents({'created_at': {'$gte': today_start}}),
+        'active_this_week': collection.count_documents({'last_active': {'$gte': week_start}}),
+        'active_this_month': collection.count_documents({'last_active': {'$gte': month_start}}),
+        'returning_users': collection.count_documents({'access_count': {'$gt': 1}})
+    }
+    daily_active = list(collection.aggregate([
+        {'$match': {'last_active': {'$gte': week_start}}},
+        {'$group': {'_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$last_active'}}, 'count': {'$sum': 1}}},
+        {'$sort': {'_id': 1}}
+    ]))
+    stats['daily_active_users'] = [
+        {'date': date, 'count': next((item['count'] for item in daily_active if item['_id'] == date), 0)}
+        for date in sorted((today_start - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7))
+    ]
+    return stats
+
+def time_runs(func, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark get_user_stats()")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="university_chatbot_bench")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the existing synthetic collection")
+    args = parser.parse_args()
+
+    collection = MongoClient(args.mongo_uri)[args.database]['users']
+    if not args.skip_seed:
+        print(f"Seeding {args.users} users...")
+        seed_users(collection, args.users)
+
+    # Point get_user_stats() at the synthetic collection
+    database.user_collection = collection
+
+    legacy, legacy_timings = time_runs(lambda: legacy_user_stats(collection), args.runs)
+    facet, facet_timings = time_runs(database.get_user_stats, args.runs)
+
+    if legacy != facet:
+        print("WARNING: results differ")
+        print(f"  legacy: {legacy}")
+        print(f"  facet:  {facet}")
+
+    for name, timings in (("7 round trips", legacy_timings), ("$facet", facet_timings)):
+        print(f"{name:>14}: median {statistics.median(timings) * 1000:.1f} ms, "
+              f"min {min(timings) * 1000:.1f} ms over {len(timings)} runs")
+
+if __name__ == "__main__":
+    main()
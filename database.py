@@ -1,25 +1,217 @@
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson import ObjectId
+from datetime import datetime, timedelta, time as dt_time
 import streamlit as st
 import bcrypt
 import uuid
 import json
+import csv
+import io
+import atexit
+import queue
+import threading
+import time
 from user_agents import parse
 import pytz
+from retrieval import find_course_mentions
+import metrics
 
 # MongoDB connection
 MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client['university_chatbot']
+if MONGO_URI.startswith("mongomock://"):
+    # In-process fake MongoDB, for benchmarks and offline experiments
+    import mongomock
+    client = mongomock.MongoClient()
+else:
+    # The listener counts and times every command for the metrics module
+    client = MongoClient(
+        MONGO_URI,
+        event_listeners=[metrics.MongoCommandListener()] if metrics.METRICS_ENABLED else []
+    )
+db = client[st.secrets.get("MONGO_DB", "university_chatbot")]
 
 # Collections
 chat_collection = db['chat_history']
 course_data_collection = db['course_data']
 admin_collection = db['admins']
 user_collection = db['users']
+answer_cache_collection = db['answer_cache']
+meta_collection = db['meta']
+metrics_collection = db['metrics']  # one snapshot per process
+
+# Daily analytics rollups, maintained as chats are written
+daily_stats_collection = db['chat_daily_stats']      # one per day: messages, unique_chatters
+daily_users_collection = db['chat_daily_users']      # one per day and user: messages
+daily_courses_collection = db['chat_daily_courses']  # one per day and course: count
+# LLM calls made outside chat turns (warm-up, summaries), so not in the chat rollups
+daily_llm_usage_collection = db['llm_daily_usage']    # one per day and purpose: tokens
+
+# Bump when INDEXES or the seed data change so deployments re-run bootstrap
+BOOTSTRAP_VERSION = 5
+
+# Indexes each collection should have, as (name, keys, options)
+INDEXES = {
+    'chat_history': [
+        ('timestamp_-1__id_-1', [('timestamp', -1), ('_id', -1)], {}),
+        ('user_id_1_timestamp_-1', [('user_id', 1), ('timestamp', -1)], {}),
+        ('course_inquiry_1_timestamp_-1', [('course_inquiry', 1), ('timestamp', -1)],
+         {'partialFilterExpression': {'course_inquiry': {'$type': 'string'}}})
+    ],
+    'users': [
+        ('user_id_1', [('user_id', 1)], {'unique': True}),
+        ('last_active_1', [('last_active', 1)], {}),
+        ('created_at_1', [('created_at', 1)], {}),
+        ('access_count_1', [('access_count', 1)],
+         {'partialFilterExpression': {'access_count': {'$gt': 1}}})
+    ],
+    'admins': [
+        ('username_1', [('username', 1)], {'unique': True}),
+        ('session_token_1', [('session_token', 1)],
+         {'partialFilterExpression': {'session_token': {'$type': 'string'}}})
+    ],
+    'answer_cache': [
+        ('catalog_version_1', [('catalog_version', 1)], {}),
+        # Let MongoDB remove shared cache entries a day after they were written
+        ('created_at_1', [('created_at', 1)], {'expireAfterSeconds': 86400})
+    ],
+    'metrics': [
+        # Snapshots of processes that stopped reporting are removed after a day
+        ('updated_at_1', [('updated_at', 1)], {'expireAfterSeconds': 86400})
+    ],
+    'chat_daily_users': [
+        ('day_1', [('day', 1)], {})
+    ],
+    'chat_daily_courses': [
+        ('day_1', [('day', 1)], {})
+    ],
+    'llm_daily_usage': [
+        ('day_1', [('day', 1)], {})
+    ]
+}
+
+# Admin sessions verified by this process: token -> {"last_seen", "written_at"}.
+# Sessions slide forward on use and expire after ADMIN_SESSION_TTL of
+# inactivity; last_login is written back at most every
+# ADMIN_LAST_LOGIN_WRITE_INTERVAL seconds per token.
+ADMIN_SESSION_TTL = timedelta(days=1)
+ADMIN_LAST_LOGIN_WRITE_INTERVAL = 60
+
+_admin_sessions = {}
+_admin_sessions_lock = threading.Lock()
+
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
+
+# How often (in seconds) each worker re-checks the catalog version in MongoDB
+CATALOG_VERSION_CHECK_INTERVAL = 5
+
+# Process-wide course catalog cache, shared by every session in this worker.
+# Holds (version, courses, last_checked) and is replaced as a whole on refresh.
+_catalog_lock = threading.Lock()
+_catalog_cache = (None, None, 0.0)
+
+# Callbacks run with (version, courses) after the catalog is updated
+_catalog_listeners = []
+
+# How often (in seconds) each worker re-reads today's total token spend.
+# Budgets are checked against the rollups, so they can be overshot by the
+# turns in flight and in the chat write queue.
+TOKEN_SPEND_CHECK_INTERVAL = 5
+
+# A rollup rebuild replaces the daily rollups from a scan of chat history,
+# so chat writers in every process hold their chats while it runs: a $inc
+# landing during the rebuild would be lost or counted twice. Writers check
+# the rebuild marker every ROLLUP_REBUILD_CHECK_INTERVAL seconds, and a
+# marker left behind by a crashed rebuild expires after ROLLUP_REBUILD_TIMEOUT.
+ROLLUP_REBUILD_CHECK_INTERVAL = 5
+ROLLUP_REBUILD_TIMEOUT = 3600
+
+_rollup_rebuild_cache = (False, 0.0)  # (rebuild running, last_checked)
+
+_token_spend_lock = threading.Lock()
+_token_spend_cache = (None, 0, 0.0)  # (day, tokens, last_checked)
+
+# Background chat writer: chats are queued and inserted in batches of up to
+# CHAT_WRITE_BATCH_SIZE, or whatever is queued after CHAT_WRITE_FLUSH_INTERVAL
+# seconds. When the queue is full, save_chat waits up to
+# CHAT_WRITE_ENQUEUE_TIMEOUT seconds and then writes the chat itself.
+CHAT_WRITE_BATCH_SIZE = 100
+CHAT_WRITE_FLUSH_INTERVAL = 1.0
+CHAT_WRITE_QUEUE_SIZE = 10000
+CHAT_WRITE_ENQUEUE_TIMEOUT = 0.5
+# Chats that fail to insert are retried this many times, after
+# CHAT_WRITE_RETRY_DELAY seconds and then twice as long each time, before
+# they are dropped
+CHAT_WRITE_MAX_RETRIES = 3
+CHAT_WRITE_RETRY_DELAY = 2.0
+
+_chat_queue = queue.Queue(maxsize=CHAT_WRITE_QUEUE_SIZE)
+_chat_write_failures = {}  # chat _id -> failed inserts so far
+_chat_retries = []  # (retry_at, chat) for chats waiting to be retried
+_chat_retry_lock = threading.Lock()
+_chat_writer_stop = threading.Event()
+_chat_writer_lock = threading.Lock()
+_chat_writer = None
+
+# User activity (access counts and last-seen times) is collected in memory
+# and written every USER_ACTIVITY_FLUSH_INTERVAL seconds in one bulk_write,
+# or sooner once USER_ACTIVITY_MAX_PENDING users are waiting. Activity from
+# the last interval is lost if the process dies.
+USER_ACTIVITY_FLUSH_INTERVAL = float(st.secrets.get("USER_ACTIVITY_FLUSH_INTERVAL", 10))
+USER_ACTIVITY_MAX_PENDING = 1000
+
+_pending_activity = {}  # user_id -> {"count", "last_active", "created_at"}
+_activity_lock = threading.Lock()
+_activity_stop = threading.Event()
+_activity_flusher = None
+
+# The activity flusher also saves a snapshot of this process's metrics every
+# METRICS_FLUSH_INTERVAL seconds
+METRICS_FLUSH_INTERVAL = float(st.secrets.get("METRICS_FLUSH_INTERVAL", 60))
 
 def init_database():
-    """Initialize database with default admin and course data if empty"""
+    """Bootstrap the database once per process, and only once per deployment"""
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return
+        marker = meta_collection.find_one({"_id": "bootstrap"})
+        if not marker or marker.get("version") != BOOTSTRAP_VERSION:
+            seed_database()
+            ensure_indexes()
+            meta_collection.update_one(
+                {"_id": "bootstrap"},
+                {"$set": {"version": BOOTSTRAP_VERSION, "completed_at": datetime.now()}},
+                upsert=True
+            )
+        # Aggregating a large chat history takes a while, so the rollup
+        # backfill runs in the background instead of blocking this rerun.
+        # Every process retries it until one of them completes it.
+        if not meta_collection.find_one({"_id": "rollup_backfill"}):
+            threading.Thread(target=backfill_chat_rollups, name="rollup-backfill", daemon=True).start()
+        _bootstrapped = True
+
+def backfill_chat_rollups():
+    """Build the daily rollups for chats saved before they existed, once per deployment"""
+    try:
+        if meta_collection.find_one({"_id": "rollup_backfill"}):
+            return
+        if not rebuild_chat_rollups():
+            return  # Another process is rebuilding them
+        meta_collection.update_one(
+            {"_id": "rollup_backfill"},
+            {"$set": {"completed_at": datetime.now()}},
+            upsert=True
+        )
+        print("Backfilled daily chat rollups")
+    except Exception as e:
+        print(f"Error backfilling chat rollups: {str(e)}")
+
+def seed_database():
+    """Add the default admin and course data if empty"""
     # Add default admin if none exists
     if admin_collection.count_documents({}) == 0:
         default_admin = {
@@ -56,10 +248,48 @@ def init_database():
                         "Sem 1": ["C Programming", "Digital Electronics", "Mathematics", "Statistics", "English"]
                     }
                 }
-            }
+            },
+            "version": 1
         }
         course_data_collection.insert_one(default_courses)
 
+def ensure_indexes():
+    """Create any declared index that doesn't exist yet"""
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        for name, keys, options in indexes:
+            if name not in existing:
+                collection.create_index(keys, name=name, **options)
+
+    drift = get_index_drift()
+    if drift:
+        print(f"Index drift detected: {drift}")
+
+def get_index_drift():
+    """Compare declared indexes with the ones in MongoDB.
+
+    Returns {collection: {"missing": [...], "changed": [...], "unexpected": [...]}}
+    for every collection whose indexes don't match INDEXES.
+    """
+    drift = {}
+    for collection_name, indexes in INDEXES.items():
+        existing = db[collection_name].index_information()
+        existing.pop('_id_', None)
+        report = {"missing": [], "changed": [], "unexpected": []}
+        for name, keys, options in indexes:
+            actual = existing.pop(name, None)
+            if actual is None:
+                report["missing"].append(name)
+            elif [tuple(key) for key in actual['key']] != keys or any(
+                actual.get(option) != value for option, value in options.items()
+            ):
+                report["changed"].append(name)
+        report["unexpected"] = sorted(existing)
+        if any(report.values()):
+            drift[collection_name] = report
+    return drift
+
 def verify_admin(username, password):
     """Verify admin credentials and create session"""
     admin = admin_collection.find_one({"username": username})
@@ -70,30 +300,76 @@ def verify_admin(username, password):
             {"username": username},
             {"$set": {"session_token": session_token, "last_login": datetime.now()}}
         )
+        # The new login replaces the previous session. Other processes notice
+        # at their next last_login write-back.
+        with _admin_sessions_lock:
+            _admin_sessions.pop(admin.get("session_token"), None)
         return session_token
     return None
 
 def verify_admin_session(session_token):
-    """Verify admin session token"""
+    """Verify admin session token, from the in-process session cache when possible"""
     if not session_token:
         return False
     try:
+        now = datetime.now()
+        with _admin_sessions_lock:
+            session = _admin_sessions.get(session_token)
+            if session and now - session["last_seen"] > ADMIN_SESSION_TTL:
+                del _admin_sessions[session_token]
+                session = None
+            if session:
+                session["last_seen"] = now
+                if time.monotonic() - session["written_at"] < ADMIN_LAST_LOGIN_WRITE_INTERVAL:
+                    return True
+
+        if session:
+            # Throttled write-back of last_login, which also notices a logout
+            # from another process
+            result = admin_collection.update_one(
+                {"session_token": session_token},
+                {"$set": {"last_login": now}}
+            )
+            with _admin_sessions_lock:
+                if result.matched_count == 0:
+                    _admin_sessions.pop(session_token, None)
+                    return False
+                session["written_at"] = time.monotonic()
+            return True
+
         # Check if session exists and is not expired (24 hours validity)
         admin = admin_collection.find_one({
             "session_token": session_token,
-            "last_login": {"$gte": datetime.now() - timedelta(days=1)}
+            "last_login": {"$gte": now - ADMIN_SESSION_TTL}
         })
         if admin:
             # Update last login time to extend session
             admin_collection.update_one(
                 {"session_token": session_token},
-                {"$set": {"last_login": datetime.now()}}
+                {"$set": {"last_login": now}}
             )
+            with _admin_sessions_lock:
+                # Expired sessions are only removed here and when used again
+                for token in [token for token, cached in _admin_sessions.items()
+                              if now - cached["last_seen"] > ADMIN_SESSION_TTL]:
+                    del _admin_sessions[token]
+                _admin_sessions[session_token] = {"last_seen": now, "written_at": time.monotonic()}
             return True
         return False
     except:
         return False
 
+def logout_admin(session_token):
+    """End an admin session"""
+    if not session_token:
+        return
+    with _admin_sessions_lock:
+        _admin_sessions.pop(session_token, None)
+    admin_collection.update_one(
+        {"session_token": session_token},
+        {"$unset": {"session_token": ""}}
+    )
+
 def get_browser_fingerprint():
     """Generate a simple browser fingerprint"""
     user_agent = st.request_header("User-Agent", "")
@@ -106,77 +382,786 @@ def get_browser_fingerprint():
     }
     return json.dumps(fingerprint)
 
+def record_user_activity(user_id, new_user=False):
+    """Record one access by a user, to be written on the next activity flush"""
+    now = datetime.now()
+    with _activity_lock:
+        entry = _pending_activity.setdefault(user_id, {"count": 0, "last_active": now, "created_at": None})
+        entry["count"] += 1
+        entry["last_active"] = now
+        if new_user:
+            entry["created_at"] = now
+        pending = len(_pending_activity)
+
+    _start_activity_flusher()
+    if pending >= USER_ACTIVITY_MAX_PENDING:
+        flush_user_activity()
+
+def flush_user_activity():
+    """Write all pending user activity in a single bulk_write"""
+    global _pending_activity
+    with _activity_lock:
+        pending, _pending_activity = _pending_activity, {}
+    if not pending:
+        return
+
+    operations = [
+        UpdateOne(
+            {'user_id': user_id},
+            {
+                '$max': {'last_active': entry['last_active']},
+                '$inc': {'access_count': entry['count']},
+                '$setOnInsert': {'created_at': entry['created_at'] or entry['last_active']}
+            },
+            upsert=True
+        )
+        for user_id, entry in pending.items()
+    ]
+    try:
+        user_collection.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error writing user activity: {str(e)}")
+        # Merge the activity back so the next flush retries it
+        with _activity_lock:
+            for user_id, entry in pending.items():
+                current = _pending_activity.get(user_id)
+                if current:
+                    current["count"] += entry["count"]
+                    current["created_at"] = current["created_at"] or entry["created_at"]
+                else:
+                    _pending_activity[user_id] = entry
+
+def _activity_flush_loop():
+    last_metrics_flush = time.monotonic()
+    while not _activity_stop.wait(USER_ACTIVITY_FLUSH_INTERVAL):
+        flush_user_activity()
+        if time.monotonic() - last_metrics_flush >= METRICS_FLUSH_INTERVAL:
+            last_metrics_flush = time.monotonic()
+            flush_metrics()
+
+def _start_activity_flusher():
+    global _activity_flusher
+    with _activity_lock:
+        if _activity_flusher is None:
+            _activity_flusher = threading.Thread(target=_activity_flush_loop, name="activity-flusher", daemon=True)
+            _activity_flusher.start()
+
+def _stop_activity_flusher():
+    _activity_stop.set()
+    flush_user_activity()
+    flush_metrics()
+
+atexit.register(_stop_activity_flusher)
+
+def flush_metrics():
+    """Save this process's metrics snapshot"""
+    if not metrics.METRICS_ENABLED:
+        return
+    try:
+        metrics_collection.replace_one(
+            {'_id': metrics.PROCESS_ID},
+            {**metrics.snapshot(), 'updated_at': datetime.now()},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error saving metrics: {str(e)}")
+
+def get_metrics_snapshots():
+    """Get the latest metrics snapshot of every process that reported recently"""
+    cutoff = datetime.now() - timedelta(seconds=METRICS_FLUSH_INTERVAL * 10)
+    return list(metrics_collection.find({'updated_at': {'$gte': cutoff}}))
+
 def get_or_create_user_session():
     """Get or create a user session with improved tracking."""
     if 'user_id' not in st.session_state:
         user_id = str(uuid.uuid4())
         st.session_state.user_id = user_id
         
-        # Create new user record
-        user_collection.insert_one({
-            'user_id': user_id,
-            'created_at': datetime.now(),
-            'last_active': datetime.now(),
-            'access_count': 1
-        })
+        # Create new user record on the next activity flush
+        record_user_activity(user_id, new_user=True)
     else:
         user_id = st.session_state.user_id
         
         # Update existing user's last active time and increment access count
-        user_collection.update_one(
-            {'user_id': user_id},
-            {
-                '$set': {'last_active': datetime.now()},
-                '$inc': {'access_count': 1}
-            }
-        )
+        record_user_activity(user_id)
     
     return user_id
 
-def save_chat(user_message, bot_response):
-    """Save chat history to database with user ID and course inquiry tracking"""
+def _write_chats(batch):
+    """Insert a batch of chat records and update the daily rollups"""
+    # Hold the chats while the rollups are rebuilt, unless shutting down
+    while _rollup_rebuild_running() and not _chat_writer_stop.is_set():
+        _chat_writer_stop.wait(ROLLUP_REBUILD_CHECK_INTERVAL)
+    # Fixed ids make retries safe: a chat an earlier attempt did insert
+    # fails again with a duplicate key instead of being stored twice
+    for chat in batch:
+        chat.setdefault('_id', ObjectId())
+    failed = []
     try:
-        user_id = get_or_create_user_session()
-        
-        # Extract course information from the message
-        courses = get_course_data()
-        course_inquiry = None
-        for course in courses.keys():
-            if course.lower() in user_message.lower():
-                course_inquiry = course
+        chat_collection.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        failed_indexes = {error['index'] for error in e.details.get('writeErrors', []) if error.get('code') != 11000}
+        failed = [chat for index, chat in enumerate(batch) if index in failed_indexes]
+        if failed:
+            print(f"Error writing {len(failed)} of {len(batch)} chats: {str(e)}")
+    except Exception as e:
+        print(f"Error writing {len(batch)} chats: {str(e)}")
+        failed = batch
+
+    for chat in failed:
+        _retry_chat(chat)
+    failed_ids = {chat['_id'] for chat in failed}
+    written = [chat for chat in batch if chat['_id'] not in failed_ids]
+    for chat in written:
+        _chat_write_failures.pop(chat['_id'], None)
+    if not written:
+        return
+    try:
+        update_chat_rollups(written)
+    except Exception as e:
+        print(f"Error updating chat rollups: {str(e)}")
+
+def _retry_chat(chat):
+    """Schedule a chat that failed to insert for a retry, or drop it after too many tries"""
+    failures = _chat_write_failures.get(chat['_id'], 0) + 1
+    with _chat_retry_lock:
+        if failures <= CHAT_WRITE_MAX_RETRIES and len(_chat_retries) < CHAT_WRITE_QUEUE_SIZE:
+            retry_at = time.monotonic() + CHAT_WRITE_RETRY_DELAY * 2 ** (failures - 1)
+            _chat_retries.append((retry_at, chat))
+            _chat_write_failures[chat['_id']] = failures
+            return
+    _chat_write_failures.pop(chat['_id'], None)
+    metrics.inc("chats_dropped_total")
+    print(f"Dropping chat {chat['_id']} after {failures} failed writes")
+
+def _take_chat_retries():
+    """Remove and return the chats whose retry is due"""
+    now = time.monotonic()
+    with _chat_retry_lock:
+        due = [chat for retry_at, chat in _chat_retries if retry_at <= now]
+        _chat_retries[:] = [(retry_at, chat) for retry_at, chat in _chat_retries if retry_at > now]
+    return due
+
+def _day(timestamp):
+    return timestamp.astimezone(pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d')
+
+def _day_range(start_date=None, end_date=None):
+    day_range = {}
+    if start_date:
+        day_range['$gte'] = start_date.strftime('%Y-%m-%d')
+    if end_date:
+        day_range['$lte'] = end_date.strftime('%Y-%m-%d')
+    return day_range
+
+def update_chat_rollups(chats):
+    """Add a batch of newly saved chats to the daily rollups with $inc upserts"""
+    user_totals = {}
+    course_counts = {}
+    multi_course = {}
+    chats = [chat for chat in chats if chat.get('status', 'ok') == 'ok']
+    if not chats:
+        return
+    for chat in chats:
+        day = _day(chat['timestamp'])
+        key = (day, chat.get('user_id') or '')
+        totals = user_totals.setdefault(key, {'messages': 0, 'input_tokens': 0, 'output_tokens': 0, 'llm_calls': 0})
+        totals['messages'] += 1
+        if 'input_tokens' in chat:
+            totals['input_tokens'] += chat['input_tokens']
+            totals['output_tokens'] += chat['output_tokens']
+            totals['llm_calls'] += 1
+        mentioned = chat.get('course_inquiries') or []
+        for course in mentioned:
+            key = (day, course)
+            course_counts[key] = course_counts.get(key, 0) + 1
+        if len(mentioned) > 1:
+            multi_course[day] = multi_course.get(day, 0) + 1
+
+    user_keys = list(user_totals)
+    result = daily_users_collection.bulk_write([
+        UpdateOne(
+            {'_id': f"{day}|{user_id}"},
+            {'$inc': user_totals[(day, user_id)], '$setOnInsert': {'day': day, 'user_id': user_id}},
+            upsert=True
+        )
+        for day, user_id in user_keys
+    ], ordered=False)
+
+    # A user's first chat of the day creates their document
+    day_totals = {}
+    for day, user_id in user_keys:
+        totals = day_totals.setdefault(day, {
+            'messages': 0, 'unique_chatters': 0, 'multi_course_messages': 0,
+            'input_tokens': 0, 'output_tokens': 0, 'llm_calls': 0
+        })
+        for field, value in user_totals[(day, user_id)].items():
+            totals[field] += value
+    for index in result.upserted_ids:
+        day_totals[user_keys[index][0]]['unique_chatters'] += 1
+    for day, count in multi_course.items():
+        day_totals[day]['multi_course_messages'] += count
+
+    daily_stats_collection.bulk_write([
+        UpdateOne({'_id': day}, {'$inc': totals}, upsert=True)
+        for day, totals in day_totals.items()
+    ], ordered=False)
+
+    if course_counts:
+        daily_courses_collection.bulk_write([
+            UpdateOne(
+                {'_id': f"{day}|{course}"},
+                {'$inc': {'count': count}, '$setOnInsert': {'day': day, 'course': course}},
+                upsert=True
+            )
+            for (day, course), count in course_counts.items()
+        ], ordered=False)
+
+def rebuild_chat_rollups(start_date=None, end_date=None):
+    """Recompute the daily rollups from raw chat history for a date range.
+
+    Chat writers in every process are paused while this runs. Returns False
+    without doing anything if another rebuild is already running.
+    """
+    started_at = _claim_rollup_rebuild()
+    if started_at is None:
+        return False
+    try:
+        # Let writers that checked the marker just before it was set finish
+        time.sleep(ROLLUP_REBUILD_CHECK_INTERVAL * 2)
+        _rebuild_chat_rollups(start_date, end_date)
+    finally:
+        meta_collection.delete_one({"_id": "rollup_rebuild", "started_at": started_at})
+    return True
+
+def _claim_rollup_rebuild():
+    """Set the rollup rebuild marker, or return None if a live one is already set"""
+    now = datetime.now()
+    try:
+        meta_collection.update_one(
+            {"_id": "rollup_rebuild", "expires_at": {"$lt": now}},
+            {"$set": {"started_at": now, "expires_at": now + timedelta(seconds=ROLLUP_REBUILD_TIMEOUT)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    return now
+
+def _rollup_rebuild_running():
+    """Whether a rollup rebuild is running in any process, re-checked every few seconds"""
+    global _rollup_rebuild_cache
+    running, checked_at = _rollup_rebuild_cache
+    if time.monotonic() - checked_at < ROLLUP_REBUILD_CHECK_INTERVAL:
+        return running
+    try:
+        running = meta_collection.find_one(
+            {"_id": "rollup_rebuild", "expires_at": {"$gt": datetime.now()}}, {"_id": 1}
+        ) is not None
+    except Exception as e:
+        print(f"Error checking for a rollup rebuild: {str(e)}")
+        running = False
+    _rollup_rebuild_cache = (running, time.monotonic())
+    return running
+
+def _rebuild_chat_rollups(start_date, end_date):
+    day_range = _day_range(start_date, end_date)
+    day_query = {'day': day_range} if day_range else {}
+    daily_users_collection.delete_many(day_query)
+    daily_courses_collection.delete_many(day_query)
+    daily_stats_collection.delete_many({'_id': day_range} if day_range else {})
+
+    day = {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp', 'timezone': 'Asia/Kolkata'}}
+    # Failed turns (fallback replies) are not counted
+    match = {'$and': [_chat_query(start_date=start_date, end_date=end_date), {'status': {'$ne': 'failed'}}]}
+    chat_collection.aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': {'day': day, 'user_id': {'$ifNull': ['$user_id', '']}},
+            'messages': {'$sum': 1},
+            'input_tokens': {'$sum': {'$ifNull': ['$input_tokens', 0]}},
+            'output_tokens': {'$sum': {'$ifNull': ['$output_tokens', 0]}},
+            # Turns answered by the LLM are the ones with token counts
+            'llm_calls': {'$sum': {'$cond': [{'$eq': [{'$type': '$input_tokens'}, 'missing']}, 0, 1]}}
+        }},
+        {'$project': {
+            '_id': {'$concat': ['$_id.day', '|', '$_id.user_id']},
+            'day': '$_id.day',
+            'user_id': '$_id.user_id',
+            'messages': 1,
+            'input_tokens': 1,
+            'output_tokens': 1,
+            'llm_calls': 1
+        }},
+        {'$merge': {'into': 'chat_daily_users', 'whenMatched': 'replace'}}
+    ])
+    # Chats saved before multi-course matching only have course_inquiry
+    mentioned = {'$ifNull': ['$course_inquiries', ['$course_inquiry']]}
+    chat_collection.aggregate([
+        {'$match': match},
+        {'$project': {'timestamp': 1, 'course': mentioned}},
+        {'$unwind': '$course'},
+        {'$match': {'course': {'$type': 'string'}}},
+        {'$group': {'_id': {'day': day, 'course': '$course'}, 'count': {'$sum': 1}}},
+        {'$project': {
+            '_id': {'$concat': ['$_id.day', '|', '$_id.course']},
+            'day': '$_id.day',
+            'course': '$_id.course',
+            'count': 1
+        }},
+        {'$merge': {'into': 'chat_daily_courses', 'whenMatched': 'replace'}}
+    ])
+    daily_users_collection.aggregate([
+        {'$match': day_query},
+        {'$group': {
+            '_id': '$day',
+            'messages': {'$sum': '$messages'},
+            'unique_chatters': {'$sum': 1},
+            'input_tokens': {'$sum': '$input_tokens'},
+            'output_tokens': {'$sum': '$output_tokens'},
+            'llm_calls': {'$sum': '$llm_calls'}
+        }},
+        {'$merge': {'into': 'chat_daily_stats', 'whenMatched': 'replace'}}
+    ])
+    chat_collection.aggregate([
+        {'$match': {'$and': [match, {'course_inquiries.1': {'$exists': True}}]}},
+        {'$group': {'_id': day, 'multi_course_messages': {'$sum': 1}}},
+        {'$merge': {'into': 'chat_daily_stats', 'whenMatched': 'merge', 'whenNotMatched': 'discard'}}
+    ])
+
+def _chat_writer_loop():
+    while not _chat_writer_stop.is_set():
+        retries = _take_chat_retries()
+        if retries:
+            _write_chats(retries)
+        try:
+            batch = [_chat_queue.get(timeout=CHAT_WRITE_FLUSH_INTERVAL)]
+        except queue.Empty:
+            continue
+        deadline = time.monotonic() + CHAT_WRITE_FLUSH_INTERVAL
+        while len(batch) < CHAT_WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_chat_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _write_chats(batch)
+        for _ in batch:
+            _chat_queue.task_done()
+
+def _start_chat_writer():
+    global _chat_writer
+    with _chat_writer_lock:
+        if _chat_writer is None:
+            _chat_writer = threading.Thread(target=_chat_writer_loop, name="chat-writer", daemon=True)
+            _chat_writer.start()
+
+def flush_chats():
+    """Stop the background writer and write every queued chat, retrying failed ones"""
+    _chat_writer_stop.set()
+    if _chat_writer is not None:
+        _chat_writer.join(timeout=CHAT_WRITE_FLUSH_INTERVAL * 5)
+    batch = []
+    while True:
+        try:
+            batch.append(_chat_queue.get_nowait())
+            _chat_queue.task_done()
+        except queue.Empty:
+            break
+        if len(batch) >= CHAT_WRITE_BATCH_SIZE:
+            _write_chats(batch)
+            batch = []
+    if batch:
+        _write_chats(batch)
+    # Each chat is written or dropped (and counted) after its last retry
+    while True:
+        with _chat_retry_lock:
+            if not _chat_retries:
                 break
+            wait = min(retry_at for retry_at, _ in _chat_retries) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        retries = _take_chat_retries()
+        if retries:
+            _write_chats(retries)
+
+atexit.register(flush_chats)
+
+def wait_for_chats():
+    """Block until every queued chat is written, leaving the background writer running"""
+    if _chat_writer is None or _chat_writer_stop.is_set():
+        flush_chats()
+        return
+    _chat_queue.join()
+    while _chat_retries:
+        time.sleep(CHAT_WRITE_FLUSH_INTERVAL)
+        _chat_queue.join()
+
+metrics.register_collector("background", lambda: {
+    'chat_queue_depth': _chat_queue.qsize(),
+    'chat_retries_pending': len(_chat_retries),
+    'pending_user_activity': len(_pending_activity)
+})
+
+def save_chat(user_message, bot_response, status="ok", usage=None):
+    """Queue a chat for saving with user ID and course inquiry tracking.
+
+    status is "ok" for real answers and "failed" for fallback replies given
+    when the LLM was unavailable; failed chats are left out of analytics.
+    usage holds the input_tokens, output_tokens and latency_ms of the LLM
+    call that produced the answer, if there was one.
+    """
+    try:
+        user_id = st.session_state.get('user_id') or get_or_create_user_session()
+        
+        # Extract every course mentioned in the message
+        version, courses, _ = _refresh_catalog()
+        course_inquiries = find_course_mentions(user_message, version, courses)
         
         chat_data = {
             "timestamp": datetime.now(pytz.timezone('Asia/Kolkata')),
             "user_id": user_id,
             "user_message": user_message,
             "bot_response": bot_response,
-            "course_inquiry": course_inquiry
+            "course_inquiry": course_inquiries[0] if course_inquiries else None,
+            "course_inquiries": course_inquiries,
+            "status": status
         }
-        chat_collection.insert_one(chat_data)
+        if usage:
+            chat_data["input_tokens"] = usage.get('input_tokens', 0)
+            chat_data["output_tokens"] = usage.get('output_tokens', 0)
+            chat_data["llm_latency_ms"] = usage.get('latency_ms')
+        _start_chat_writer()
+        try:
+            _chat_queue.put(chat_data, timeout=CHAT_WRITE_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            # Backpressure: the writer is behind, so save this one directly
+            _write_chats([chat_data])
     except Exception as e:
         st.error("An error occurred while saving the chat. Please try again.")
         print(f"Error saving chat: {str(e)}")  # Log the error for debugging
 
-def get_chat_history(user_id=None):
-    """Get chat history, optionally filtered by user_id"""
-    query = {}
+def _ist_range(start_date=None, end_date=None):
+    """Convert inclusive IST dates into a timestamp query"""
+    ist = pytz.timezone('Asia/Kolkata')
+    time_range = {}
+    if start_date:
+        time_range["$gte"] = ist.localize(datetime.combine(start_date, dt_time.min))
+    if end_date:
+        time_range["$lt"] = ist.localize(datetime.combine(end_date + timedelta(days=1), dt_time.min))
+    return time_range
+
+def _chat_query(user_id=None, start_date=None, end_date=None, before=None):
+    conditions = []
     if user_id:
-        query["user_id"] = user_id
-    return list(chat_collection.find(query).sort("timestamp", -1))
+        conditions.append({"user_id": user_id})
+    time_range = _ist_range(start_date, end_date)
+    if time_range:
+        conditions.append({"timestamp": time_range})
+    if before:
+        # Keyset pagination: everything after the given row in (timestamp, _id) order
+        conditions.append({"$or": [
+            {"timestamp": {"$lt": before["timestamp"]}},
+            {"timestamp": before["timestamp"], "_id": {"$lt": before["_id"]}}
+        ]})
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def get_chat_history(user_id=None, start_date=None, end_date=None, fields=None, limit=None, before=None):
+    """Get chat history newest first, filtered and paginated in MongoDB.
+
+    start_date and end_date are inclusive dates in IST. fields limits the
+    returned fields (timestamp and _id are always included). Pass the last
+    row of a page as before to get the next page.
+    """
+    projection = None
+    if fields:
+        projection = {field: 1 for field in fields}
+        projection["timestamp"] = 1
+    cursor = chat_collection.find(
+        _chat_query(user_id, start_date, end_date, before),
+        projection
+    ).sort([("timestamp", -1), ("_id", -1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+# Columns written by export_chat_history
+EXPORT_FIELDS = ['timestamp', 'user_id', 'user_message', 'bot_response', 'course_inquiry', 'course_inquiries', 'status',
+                 'input_tokens', 'output_tokens', 'llm_latency_ms']
+EXPORT_BATCH_SIZE = 1000
+
+def iter_chat_history(start_date=None, end_date=None, fields=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield chat history for a date range in lists of at most batch_size rows"""
+    projection = {field: 1 for field in fields} if fields else None
+    cursor = chat_collection.find(
+        _chat_query(start_date=start_date, end_date=end_date),
+        projection
+    ).sort([("timestamp", -1), ("_id", -1)]).batch_size(batch_size)
+    batch = []
+    for chat in cursor:
+        batch.append(chat)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def export_chat_history(out, start_date=None, end_date=None, file_format="csv"):
+    """Write chat history for a date range to a binary file, one batch at a time.
+
+    Supports "csv" and "parquet" (zstd compressed, needs pyarrow). Returns the
+    number of rows written.
+    """
+    batches = iter_chat_history(start_date, end_date, EXPORT_FIELDS)
+    rows = 0
+
+    if file_format == "csv":
+        text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+        writer = csv.DictWriter(text, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+        text.flush()
+        text.detach()
+        return rows
+
+    if file_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ('timestamp', pa.timestamp('ms', tz='UTC')),
+            ('user_id', pa.string()),
+            ('user_message', pa.string()),
+            ('bot_response', pa.string()),
+            ('course_inquiry', pa.string()),
+            ('course_inquiries', pa.list_(pa.string())),
+            ('status', pa.string()),
+            ('input_tokens', pa.int64()),
+            ('output_tokens', pa.int64()),
+            ('llm_latency_ms', pa.float64())
+        ])
+        with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+            for batch in batches:
+                columns = {field: [chat.get(field) for chat in batch] for field in EXPORT_FIELDS}
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                rows += len(batch)
+        return rows
+
+    raise ValueError(f"Unsupported export format: {file_format}")
+
+def get_chat_metrics(start_date=None, end_date=None):
+    """Count messages, active days and unique chatters in a date range from the daily rollups"""
+    day_range = _day_range(start_date, end_date)
+
+    days = list(daily_stats_collection.find({'_id': day_range} if day_range else {}))
+    chatters = next(daily_users_collection.aggregate([
+        {'$match': {'day': day_range} if day_range else {}},
+        {'$group': {'_id': '$user_id'}},
+        {'$count': 'users'}
+    ]), None)
+    return {
+        'messages': sum(day.get('messages', 0) for day in days),
+        'days': sum(1 for day in days if day.get('messages')),
+        'users': chatters['users'] if chatters else 0
+    }
+
+def record_llm_usage(purpose, usage):
+    """Add the tokens of an LLM call made outside a chat turn to today's usage"""
+    try:
+        day = _day(datetime.now(pytz.timezone('Asia/Kolkata')))
+        daily_llm_usage_collection.update_one(
+            {'_id': f"{day}|{purpose}"},
+            {
+                '$inc': {
+                    'input_tokens': usage.get('input_tokens') or 0,
+                    'output_tokens': usage.get('output_tokens') or 0,
+                    'llm_calls': 1
+                },
+                '$setOnInsert': {'day': day, 'purpose': purpose}
+            },
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error recording {purpose} LLM usage: {str(e)}")
+
+def get_token_spend(user_id):
+    """Get the tokens used today (IST) by a user and by everyone, from the daily rollups"""
+    global _token_spend_cache
+    today = _day(datetime.now(pytz.timezone('Asia/Kolkata')))
+    fields = {'input_tokens': 1, 'output_tokens': 1}
+    user_day = daily_users_collection.find_one({'_id': f"{today}|{user_id}"}, fields) or {}
+
+    day, total, checked_at = _token_spend_cache
+    if day != today or time.monotonic() - checked_at >= TOKEN_SPEND_CHECK_INTERVAL:
+        with _token_spend_lock:
+            day, total, checked_at = _token_spend_cache
+            if day != today or time.monotonic() - checked_at >= TOKEN_SPEND_CHECK_INTERVAL:
+                stats = daily_stats_collection.find_one({'_id': today}, fields) or {}
+                total = stats.get('input_tokens', 0) + stats.get('output_tokens', 0)
+                for usage in daily_llm_usage_collection.find({'day': today}, fields):
+                    total += usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+                _token_spend_cache = (today, total, time.monotonic())
+    return {
+        'user': user_day.get('input_tokens', 0) + user_day.get('output_tokens', 0),
+        'total': total
+    }
+
+def get_token_usage(start_date=None, end_date=None, top_users=10):
+    """Get daily token spend and the heaviest users in a date range from the daily rollups.
+
+    Tokens spent outside chat turns are reported per day as
+    background_input_tokens and background_output_tokens.
+    """
+    day_range = _day_range(start_date, end_date)
+    days = {
+        day['_id']: day
+        for day in daily_stats_collection.find(
+            {'_id': day_range} if day_range else {},
+            {'input_tokens': 1, 'output_tokens': 1, 'llm_calls': 1, 'messages': 1}
+        )
+    }
+    background = {}
+    for usage in daily_llm_usage_collection.find({'day': day_range} if day_range else {}):
+        totals = background.setdefault(usage['day'], {'input_tokens': 0, 'output_tokens': 0})
+        totals['input_tokens'] += usage.get('input_tokens', 0)
+        totals['output_tokens'] += usage.get('output_tokens', 0)
+    users = list(daily_users_collection.aggregate([
+        {'$match': {'day': day_range} if day_range else {}},
+        {'$group': {
+            '_id': '$user_id',
+            'input_tokens': {'$sum': '$input_tokens'},
+            'output_tokens': {'$sum': '$output_tokens'},
+            'llm_calls': {'$sum': '$llm_calls'}
+        }},
+        {'$addFields': {'tokens': {'$add': ['$input_tokens', '$output_tokens']}}},
+        {'$match': {'tokens': {'$gt': 0}}},
+        {'$sort': {'tokens': -1}},
+        {'$limit': top_users}
+    ]))
+    return {
+        'days': [
+            {
+                'day': day,
+                'input_tokens': days.get(day, {}).get('input_tokens', 0),
+                'output_tokens': days.get(day, {}).get('output_tokens', 0),
+                'llm_calls': days.get(day, {}).get('llm_calls', 0),
+                'messages': days.get(day, {}).get('messages', 0),
+                'background_input_tokens': background.get(day, {}).get('input_tokens', 0),
+                'background_output_tokens': background.get(day, {}).get('output_tokens', 0)
+            }
+            for day in sorted(days.keys() | background.keys())
+        ],
+        'top_users': users
+    }
+
+def get_costliest_chats(start_date=None, end_date=None, limit=20):
+    """Get the chats that used the most tokens in a date range"""
+    return list(chat_collection.aggregate([
+        {'$match': {'$and': [_chat_query(start_date=start_date, end_date=end_date),
+                             {'input_tokens': {'$exists': True}}]}},
+        {'$project': {
+            'timestamp': 1, 'user_id': 1, 'user_message': 1,
+            'input_tokens': 1, 'output_tokens': 1, 'llm_latency_ms': 1,
+            'tokens': {'$add': ['$input_tokens', '$output_tokens']}
+        }},
+        {'$sort': {'tokens': -1}},
+        {'$limit': limit}
+    ]))
+
+def _refresh_catalog():
+    """Reload the cached catalog if its version in MongoDB has changed"""
+    global _catalog_cache
+    version, courses, checked_at = _catalog_cache
+    if courses is not None and time.monotonic() - checked_at < CATALOG_VERSION_CHECK_INTERVAL:
+        return _catalog_cache
+
+    with _catalog_lock:
+        version, courses, checked_at = _catalog_cache
+        now = time.monotonic()
+        if courses is not None and now - checked_at < CATALOG_VERSION_CHECK_INTERVAL:
+            return _catalog_cache
+
+        # Cheap check first: only fetch the version stamp
+        if courses is not None:
+            stamp = course_data_collection.find_one({}, {"version": 1})
+            if stamp and stamp.get("version", 0) == version:
+                _catalog_cache = (version, courses, now)
+                return _catalog_cache
+
+        data = course_data_collection.find_one()
+        if data:
+            _catalog_cache = (data.get("version", 0), data.get("courses", {}), now)
+        else:
+            _catalog_cache = (0, {}, now)
+        return _catalog_cache
+
+def on_catalog_change(callback):
+    """Register a callback to run with (version, courses) after each catalog update"""
+    _catalog_listeners.append(callback)
 
 def get_course_data():
-    """Get course data"""
-    data = course_data_collection.find_one()
-    return data['courses'] if data else {}
+    """Get course data from the process-wide catalog cache.
+
+    The returned dict is shared between sessions and must not be modified.
+    """
+    return _refresh_catalog()[1]
+
+def get_catalog_version():
+    """Get the version stamp of the current course catalog"""
+    return _refresh_catalog()[0]
 
 def update_course_data(courses):
-    """Update course data"""
-    course_data_collection.update_one(
-        {}, 
-        {"$set": {"courses": courses}}, 
-        upsert=True
+    """Update course data and bump the catalog version"""
+    global _catalog_cache
+    data = course_data_collection.find_one_and_update(
+        {},
+        {"$set": {"courses": courses}, "$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
+    with _catalog_lock:
+        _catalog_cache = (data["version"], data["courses"], time.monotonic())
+
+    # Cached answers for the previous catalog are stale now
+    answer_cache_collection.delete_many({"catalog_version": {"$ne": data["version"]}})
+
+    for callback in _catalog_listeners:
+        try:
+            callback(data["version"], data["courses"])
+        except Exception as e:
+            print(f"Error in catalog change callback: {str(e)}")
+
+def get_shared_answer(question, catalog_version, ttl):
+    """Get an answer from the cross-process answer cache"""
+    try:
+        entry = answer_cache_collection.find_one({
+            "_id": f"{catalog_version}:{question}",
+            "created_at": {"$gte": datetime.now() - timedelta(seconds=ttl)}
+        })
+        return entry["answer"] if entry else None
+    except Exception as e:
+        print(f"Error reading answer cache: {str(e)}")
+        return None
+
+def save_shared_answer(question, catalog_version, answer):
+    """Store an answer in the cross-process answer cache"""
+    try:
+        answer_cache_collection.replace_one(
+            {"_id": f"{catalog_version}:{question}"},
+            {
+                "question": question,
+                "catalog_version": catalog_version,
+                "answer": answer,
+                "created_at": datetime.now()
+            },
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error saving to answer cache: {str(e)}")
 
 def get_user_stats():
     """Get comprehensive user statistics."""
@@ -186,58 +1171,59 @@ def get_user_stats():
         week_start = today_start - timedelta(days=7)
         month_start = today_start - timedelta(days=30)
         
-        # Total users
-        total_users = user_collection.count_documents({})
-        
-        # Active users today
-        active_today = user_collection.count_documents({
-            'last_active': {'$gte': today_start}
-        })
-        
-        # New users today
-        new_users_today = user_collection.count_documents({
-            'created_at': {'$gte': today_start}
-        })
-        
-        # Active users this week
-        active_this_week = user_collection.count_documents({
-            'last_active': {'$gte': week_start}
-        })
-        
-        # Active users this month
-        active_this_month = user_collection.count_documents({
-            'last_active': {'$gte': month_start}
-        })
-        
-        # Returning users
-        returning_users = user_collection.count_documents({
-            'access_count': {'$gt': 1}
-        })
-        
-        # Daily active users for the last 7 days
+        # All counters and the daily active series in one server-side pass
         pipeline = [
             {
-                '$match': {
-                    'last_active': {'$gte': week_start}
+                '$project': {
+                    'last_active': 1,
+                    'created_at': 1,
+                    'access_count': 1
                 }
             },
             {
-                '$group': {
-                    '_id': {
-                        '$dateToString': {
-                            'format': '%Y-%m-%d',
-                            'date': '$last_active'
+                '$facet': {
+                    'counts': [
+                        {
+                            '$group': {
+                                '_id': None,
+                                'total_users': {'$sum': 1},
+                                'active_today': {'$sum': {'$cond': [{'$gte': ['$last_active', today_start]}, 1, 0]}},
+                                'new_users_today': {'$sum': {'$cond': [{'$gte': ['$created_at', today_start]}, 1, 0]}},
+                                'active_this_week': {'$sum': {'$cond': [{'$gte': ['$last_active', week_start]}, 1, 0]}},
+                                'active_this_month': {'$sum': {'$cond': [{'$gte': ['$last_active', month_start]}, 1, 0]}},
+                                'returning_users': {'$sum': {'$cond': [{'$gt': ['$access_count', 1]}, 1, 0]}}
+                            }
+                        }
+                    ],
+                    # Daily active users for the last 7 days
+                    'daily_active': [
+                        {
+                            '$match': {
+                                'last_active': {'$gte': week_start}
+                            }
+                        },
+                        {
+                            '$group': {
+                                '_id': {
+                                    '$dateToString': {
+                                        'format': '%Y-%m-%d',
+                                        'date': '$last_active'
+                                    }
+                                },
+                                'count': {'$sum': 1}
+                            }
+                        },
+                        {
+                            '$sort': {'_id': 1}
                         }
-                    },
-                    'count': {'$sum': 1}
+                    ]
                 }
-            },
-            {
-                '$sort': {'_id': 1}
             }
         ]
         
-        daily_active = list(user_collection.aggregate(pipeline))
+        result = next(user_collection.aggregate(pipeline))
+        counts = result['counts'][0] if result['counts'] else {}
+        daily_active = result['daily_active']
         
         # Ensure we have data for all 7 days
         daily_active_users = []
@@ -252,12 +1238,12 @@ def get_user_stats():
         daily_active_users.sort(key=lambda x: x['date'])
         
         return {
-            'total_users': total_users,
-            'active_today': active_today,
-            'new_users_today': new_users_today,
-            'active_this_week': active_this_week,
-            'active_this_month': active_this_month,
-            'returning_users': returning_users,
+            'total_users': counts.get('total_users', 0),
+            'active_today': counts.get('active_today', 0),
+            'new_users_today': counts.get('new_users_today', 0),
+            'active_this_week': counts.get('active_this_week', 0),
+            'active_this_month': counts.get('active_this_month', 0),
+            'returning_users': counts.get('returning_users', 0),
             'daily_active_users': daily_active_users
         }
     except Exception as e:
@@ -265,17 +1251,12 @@ def get_user_stats():
         return {}
 
 def get_course_inquiry_stats():
-    """Get statistics about course inquiries"""
+    """Get statistics about course inquiries from the daily rollups"""
     pipeline = [
-        {
-            '$match': {
-                'course_inquiry': {'$ne': None}
-            }
-        },
         {
             '$group': {
-                '_id': '$course_inquiry',
-                'count': {'$sum': 1}
+                '_id': '$course',
+                'count': {'$sum': '$count'}
             }
         },
         {
@@ -283,14 +1264,20 @@ def get_course_inquiry_stats():
         }
     ]
     
-    course_stats = list(chat_collection.aggregate(pipeline))
+    course_stats = list(daily_courses_collection.aggregate(pipeline))
+    
+    # Messages that asked about more than one course
+    multi = next(daily_stats_collection.aggregate([
+        {'$group': {'_id': None, 'count': {'$sum': '$multi_course_messages'}}}
+    ]), None)
     
     # Convert to format suitable for pie chart
     total_inquiries = sum(stat['count'] for stat in course_stats)
     course_distribution = {
         'labels': [stat['_id'] for stat in course_stats],
         'values': [stat['count'] for stat in course_stats],
-        'total_inquiries': total_inquiries
+        'total_inquiries': total_inquiries,
+        'multi_course_messages': multi['count'] if multi else 0
     }
     
     return course_distribution
@@ -0,0 +1,155 @@
+import re
+import threading
+import metrics
+from retrieval import find_course_mentions, strip_course_mentions, tokenize
+
+# Patterns for the questions the catalog can answer directly
+INTENT_PATTERNS = {
+    'fees': re.compile(r"\b(fees?|cost|costs|tuition|price)\b"),
+    'duration': re.compile(r"\b(how long|duration|length)\b"),
+    'semesters': re.compile(r"\b(how many semesters|number of semesters)\b"),
+    'subjects': re.compile(r"\b(subjects?|syllabus|curriculum|taught|papers)\b")
+}
+
+# Words that signal an open-ended question better left to the LLM
+OPEN_ENDED = re.compile(r"\b(compare|comparison|vs|versus|better|best|why|should|career|scope|admission|eligibility|difference)\b")
+
+# Words that don't change what a fact question asks. Any other word left after
+# removing these, the course and the intent keywords (like "hostel" in "hostel
+# fee") means the question may be about something the catalog doesn't hold.
+FILLER_WORDS = set("""
+a an the is are was be of for in on at to do does did have has what whats which how much many
+i me my we our you your can could would will please tell about there it its this that and or with
+per s program programme course degree structure details total amount charged take complete years
+""".split())
+
+SEMESTER_PATTERN = re.compile(
+    r"\b(?:(first|second|third|fourth|fifth|sixth|seventh|eighth)|(\d)(?:st|nd|rd|th))\s+sem(?:ester)?\b"
+    r"|\bsem(?:ester)?\s*(\d)\b"
+)
+ORDINALS = ['first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh', 'eighth']
+
+# How much of the traffic the fast path absorbs
+stats = {'answered': 0, 'fallback': 0}
+_stats_lock = threading.Lock()
+metrics.register_collector("fast_path", lambda: stats)
+
+def _semester(message):
+    match = SEMESTER_PATTERN.search(message)
+    if not match:
+        return None
+    word, number, sem_number = match.groups()
+    return ORDINALS.index(word) + 1 if word else int(number or sem_number)
+
+def _record(answered):
+    with _stats_lock:
+        stats['answered' if answered else 'fallback'] += 1
+
+def _answer(intent, name, course, semester):
+    if intent == 'fees' and course.get('fees'):
+        return f"💰 The fee for **{name}** is **{course['fees']}**."
+    if intent == 'duration' and course.get('duration'):
+        answer = f"⏳ The **{name}** program is **{course['duration']}** long"
+        if course.get('semesters'):
+            answer += f" ({course['semesters']} semesters)"
+        return answer + "."
+    if intent == 'semesters' and course.get('semesters'):
+        return f"📅 The **{name}** program has **{course['semesters']} semesters**."
+    if intent == 'subjects' and isinstance(course.get('subjects'), dict):
+        subjects = course['subjects']
+        if semester:
+            listed = subjects.get(f"Sem {semester}")
+            if not listed:
+                return None
+            items = "\n".join(f"- {subject}" for subject in listed)
+            return f"📚 Subjects in **{name}** semester {semester}:\n\n{items}"
+        sections = []
+        for sem, listed in subjects.items():
+            items = "\n".join(f"- {subject}" for subject in listed)
+            sections.append(f"**{sem}**\n\n{items}")
+        return f"📚 Subjects in **{name}**:\n\n" + "\n\n".join(sections) if sections else None
+    return None
+
+def _unknown_words(text, catalog_version, courses):
+    """Words of a question that aren't a course, an intent keyword, a semester or filler"""
+    text = strip_course_mentions(text, catalog_version, courses)
+    for pattern in list(INTENT_PATTERNS.values()) + [SEMESTER_PATTERN]:
+        text = pattern.sub(" ", text)
+    return [word for word in tokenize(text) if word not in FILLER_WORDS]
+
+def _catalog_answer(message, catalog_version, courses):
+    """Get (confidence, answer) for a question from the catalog"""
+    text = message.lower()
+    mentioned = find_course_mentions(text, catalog_version, courses)
+    intents = [intent for intent, pattern in INTENT_PATTERNS.items() if pattern.search(text)]
+
+    # Confidence: a single fact asked about a single course, with no open-ended cues
+    confidence = 0.0
+    if intents:
+        confidence += 0.5 if len(intents) == 1 else 0.2
+    if len(mentioned) == 1:
+        confidence += 0.4
+    if len(text.split()) <= 12:
+        confidence += 0.1
+    if OPEN_ENDED.search(text):
+        confidence -= 0.5
+    if intents and _unknown_words(text, catalog_version, courses):
+        confidence -= 0.5
+
+    answer = None
+    if intents and len(mentioned) == 1:
+        name = mentioned[0]
+        course = courses.get(name)
+        if isinstance(course, dict):
+            answer = _answer(intents[0], name, course, _semester(text))
+    return confidence, answer
+
+def answer_from_catalog(message, catalog_version, courses, threshold=0.8):
+    """Answer simple fact questions straight from the catalog, or return None"""
+    confidence, answer = _catalog_answer(message, catalog_version, courses)
+    if confidence < threshold:
+        answer = None
+    _record(answer is not None)
+    return answer
+
+# Questions checked by `python manage.py check-fast-path`, with whether the
+# fast path should answer them from the default catalog
+FAST_PATH_CHECKS = [
+    ("What is the fee structure for BCA?", True),
+    ("How long is the B.Tech program?", True),
+    ("How many semesters does BCA have?", True),
+    ("What subjects are taught in B.Sc first semester?", True),
+    ("What are the subjects in BCA?", True),
+    ("What is the hostel fee for B.Tech?", False),
+    ("Does BCA have a fee waiver for girls?", False),
+    ("Is the B.Tech fee refundable?", False),
+    ("What is the exam fee for B.Sc?", False),
+    ("Can you compare the fees of B.Tech and BCA?", False),
+    ("Which BCA subjects are hardest?", False),
+    ("Is engineering mechanics taught in BCA?", False)
+]
+
+def check_threshold(catalog_version, courses, threshold=0.8, checks=FAST_PATH_CHECKS):
+    """Get (question, expected, confidence) for each check the threshold gets wrong"""
+    failures = []
+    for question, expected in checks:
+        confidence, answer = _catalog_answer(question, catalog_version, courses)
+        if (answer is not None and confidence >= threshold) != expected:
+            failures.append((question, expected, confidence))
+    return failures
+
+def fallback_answer(message, catalog_version, courses):
+    """Best-effort answer from the catalog for when Gemini is unavailable"""
+    _, answer = _catalog_answer(message, catalog_version, courses)
+    if answer:
+        return answer
+    lines = []
+    for name, course in courses.items():
+        details = [course.get(field) for field in ('duration', 'fees')] if isinstance(course, dict) else []
+        details = ", ".join(str(detail) for detail in details if detail)
+        lines.append(f"- **{name}**" + (f": {details}" if details else ""))
+    return (
+        "⚠️ I'm having trouble reaching my AI service right now, but here is an overview of our courses:\n\n"
+        + "\n".join(lines)
+        + "\n\nPlease try your question again in a little while."
+    )
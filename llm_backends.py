@@ -0,0 +1,138 @@
+import hashlib
+import math
+import random
+import time
+from memory import estimate_tokens
+
+class TransientLLMError(Exception):
+    """A backend failure worth retrying: rate limits, overload or network errors"""
+
+class GeminiModel:
+    """Google Gemini model with a fixed system instruction"""
+
+    def __init__(self, genai, retryable_errors, model_name, system_instruction=None):
+        self._model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        self._retryable_errors = retryable_errors
+
+    def generate(self, contents, stream=False, timeout=None, usage=None):
+        """Yield the response text in chunks.
+
+        If a usage dict is given, input_tokens and output_tokens are set in it
+        once the response is complete.
+        """
+        try:
+            response = self._model.generate_content(
+                contents,
+                stream=stream,
+                request_options={"timeout": timeout} if timeout else None
+            )
+            for chunk in response:
+                if chunk.parts:
+                    yield chunk.text
+            metadata = getattr(response, 'usage_metadata', None)
+            if usage is not None and metadata:
+                usage['input_tokens'] = metadata.prompt_token_count
+                usage['output_tokens'] = metadata.candidates_token_count
+        except self._retryable_errors as e:
+            raise TransientLLMError(str(e)) from e
+
+class GeminiBackend:
+    """Backend calling the Google Gemini API"""
+
+    name = "gemini"
+
+    def __init__(self, api_key, model_name='gemini-2.0-flash'):
+        import google.generativeai as genai
+        from google.api_core import exceptions as api_exceptions
+
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model_name = model_name
+        self.retryable_errors = (
+            api_exceptions.ResourceExhausted,
+            api_exceptions.TooManyRequests,
+            api_exceptions.ServiceUnavailable,
+            api_exceptions.InternalServerError,
+            api_exceptions.DeadlineExceeded
+        )
+
+    def get_model(self, system_instruction=None):
+        return GeminiModel(self.genai, self.retryable_errors, self.model_name, system_instruction)
+
+# Filler vocabulary for stub answers
+STUB_WORDS = (
+    "the program covers core subjects with practical labs and projects "
+    "students can expect regular assessments internships and elective courses "
+    "fees are charged per semester and scholarships may be available"
+).split()
+
+class StubModel:
+    """Offline model that answers deterministically with simulated timing"""
+
+    def __init__(self, backend, system_instruction=None):
+        self.backend = backend
+        self.system_instruction = system_instruction
+
+    def _answer_words(self, contents):
+        if isinstance(contents, str):
+            question = contents
+        else:
+            question = " ".join(str(part) for part in contents[-1]["parts"])
+        # Same question, same answer
+        offset = int(hashlib.sha1(question.encode('utf-8')).hexdigest(), 16) % len(STUB_WORDS)
+        words = f"(stub answer) You asked: {question[-200:]}".split()
+        while len(words) < self.backend.response_tokens:
+            words.append(STUB_WORDS[(offset + len(words)) % len(STUB_WORDS)])
+        return words[:max(self.backend.response_tokens, 1)]
+
+    def generate(self, contents, stream=False, timeout=None, usage=None):
+        """Yield the response text in chunks after simulated latency"""
+        backend = self.backend
+        latency, fails = backend.draw()
+        if timeout and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Stub request timed out")
+        time.sleep(latency)
+        if fails:
+            raise TransientLLMError("Injected stub failure")
+
+        words = self._answer_words(contents)
+        if not stream:
+            time.sleep(len(words) / backend.tokens_per_second)
+            yield " ".join(words)
+        else:
+            for start in range(0, len(words), backend.chunk_tokens):
+                chunk = words[start:start + backend.chunk_tokens]
+                time.sleep(len(chunk) / backend.tokens_per_second)
+                yield (" " if start else "") + " ".join(chunk)
+        if usage is not None:
+            usage['input_tokens'] = estimate_tokens(self.system_instruction) + estimate_tokens(str(contents))
+            usage['output_tokens'] = len(words)
+
+class StubBackend:
+    """Local stand-in for Gemini, for load testing and profiling.
+
+    First-token latency is log-normal with the given median (ms) and sigma,
+    output is produced at tokens_per_second, and failure_rate of the calls
+    raise a retryable error.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms=800, latency_sigma=0.5, tokens_per_second=50,
+                 response_tokens=120, chunk_tokens=8, failure_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.chunk_tokens = chunk_tokens
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def draw(self):
+        """Draw (first-token latency in seconds, whether the call fails)"""
+        latency = self._random.lognormvariate(math.log(max(self.latency_ms, 1) / 1000), self.latency_sigma)
+        return latency, self._random.random() < self.failure_rate
+
+    def get_model(self, system_instruction=None):
+        return StubModel(self, system_instruction)
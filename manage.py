@@ -0,0 +1,78 @@
+"""Maintenance commands for the chatbot database.
+
+Run from the project root so .streamlit/secrets.toml is found:
+
+    python manage.py bootstrap      # seed defaults and create indexes
+    python manage.py index-drift    # compare declared and actual indexes
+    python manage.py rebuild-rollups [--start 2025-01-01] [--end 2025-01-31]
+    python manage.py export --start 2025-01-01 --end 2025-01-31 --format parquet -o chats.parquet
+    python manage.py metrics        # Prometheus text for all app processes
+    python manage.py check-fast-path [--threshold 0.8]
+"""
+import argparse
+import json
+from datetime import date
+import database
+import metrics
+import fast_path
+
+def bootstrap(args):
+    database.seed_database()
+    database.ensure_indexes()
+    database.backfill_chat_rollups()
+    print("Bootstrap complete")
+
+def index_drift(args):
+    drift = database.get_index_drift()
+    print(json.dumps(drift, indent=2) if drift else "Indexes match the declared set")
+
+def rebuild_rollups(args):
+    if not database.rebuild_chat_rollups(args.start, args.end):
+        print("Another rollup rebuild is running")
+        raise SystemExit(1)
+    print("Daily chat rollups rebuilt")
+
+def export(args):
+    with open(args.output, "wb") as out:
+        rows = database.export_chat_history(out, args.start, args.end, args.format)
+    print(f"Exported {rows} chats to {args.output}")
+
+def print_metrics(args):
+    # Suitable for node_exporter's textfile collector or a scrape proxy
+    print(metrics.render_prometheus(database.get_metrics_snapshots()), end="")
+
+def check_fast_path(args):
+    failures = fast_path.check_threshold(
+        database.get_catalog_version(), database.get_course_data(), args.threshold
+    )
+    for question, expected, confidence in failures:
+        action = "should answer" if expected else "should not answer"
+        print(f"Fast path {action}: {question!r} (confidence {confidence:.2f})")
+    print(f"{len(fast_path.FAST_PATH_CHECKS) - len(failures)}/{len(fast_path.FAST_PATH_CHECKS)} fast path checks passed")
+    if failures:
+        raise SystemExit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("bootstrap", help="seed defaults and create indexes").set_defaults(func=bootstrap)
+    commands.add_parser("index-drift", help="report index drift").set_defaults(func=index_drift)
+    rollup_parser = commands.add_parser("rebuild-rollups", help="recompute daily analytics rollups")
+    rollup_parser.add_argument("--start", type=date.fromisoformat, help="first day (YYYY-MM-DD, IST)")
+    rollup_parser.add_argument("--end", type=date.fromisoformat, help="last day (YYYY-MM-DD, IST)")
+    rollup_parser.set_defaults(func=rebuild_rollups)
+    export_parser = commands.add_parser("export", help="export chat history for a date range")
+    export_parser.add_argument("--start", type=date.fromisoformat, help="first day (YYYY-MM-DD, IST)")
+    export_parser.add_argument("--end", type=date.fromisoformat, help="last day (YYYY-MM-DD, IST)")
+    export_parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    export_parser.add_argument("-o", "--output", required=True, help="file to write")
+    export_parser.set_defaults(func=export)
+    commands.add_parser("metrics", help="print app metrics in the Prometheus text format").set_defaults(func=print_metrics)
+    check_parser = commands.add_parser("check-fast-path", help="check which sample questions the fast path answers")
+    check_parser.add_argument("--threshold", type=float, default=0.8, help="FAST_PATH_THRESHOLD to check")
+    check_parser.set_defaults(func=check_fast_path)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
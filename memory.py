@@ -0,0 +1,138 @@
+import threading
+import metrics
+
+def estimate_tokens(text):
+    """Roughly estimate the number of tokens in a piece of text"""
+    # ~4 characters per token is close enough for budgeting purposes
+    return len(text) // 4 + 1 if text else 0
+
+def extractive_summary(summary, turns, max_tokens):
+    """Fold turns into a summary by keeping the start of each message"""
+    lines = [summary] if summary else []
+    for user, bot in turns:
+        lines.append(f"User asked: {user[:150]}")
+        lines.append(f"Assistant answered: {bot[:150]}")
+    text = "\n".join(lines)
+    # Keep the most recent part of the summary when it grows too long
+    return text[-max_tokens * 4:]
+
+class ConversationMemory:
+    """Bounded conversation memory: recent turns verbatim plus a running summary.
+
+    Once the memory grows past token_budget, the oldest turns are folded into
+    the summary until it is back under low_water (half the budget by
+    default), keeping at most keep_turns and at least the latest turn.
+    """
+
+    def __init__(self, token_budget=2000, keep_turns=4, summary_tokens=300, summarize=None, low_water=None):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+        self.low_water = low_water if low_water is not None else token_budget // 2
+        self.summary = ""
+        self.turns = []  # (user_msg, bot_msg) tuples kept verbatim
+        self.stats = {
+            'compactions': 0,
+            'tokens_before': 0,
+            'tokens_after': 0,
+            'summarized_turns': 0
+        }
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    def token_count(self):
+        """Estimated tokens this memory adds to each request"""
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(user) + estimate_tokens(bot) for user, bot in self.turns
+        )
+
+    def add_turn(self, user_message, bot_response, background=False):
+        """Record a finished turn and compact the memory if over budget.
+
+        With background=True the compaction (and any summarization call)
+        runs on its own thread instead of delaying the caller.
+        """
+        with self._lock:
+            self.turns.append((user_message, bot_response))
+            compact = not self._compacting and self.token_count() > self.token_budget
+            if compact:
+                self._compacting = True
+        if not compact:
+            return
+        if background:
+            threading.Thread(target=self._compact, name="memory-compaction", daemon=True).start()
+        else:
+            self._compact()
+
+    def compact(self):
+        """Fold the oldest turns into the running summary"""
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        self._compact()
+
+    def _compact(self):
+        try:
+            with self._lock:
+                tokens_before = self.token_count()
+                split = max(len(self.turns) - max(self.keep_turns, 1), 0)
+                remaining = tokens_before - sum(
+                    estimate_tokens(user) + estimate_tokens(bot) for user, bot in self.turns[:split]
+                )
+                while split < len(self.turns) - 1 and remaining > self.low_water:
+                    user, bot = self.turns[split]
+                    remaining -= estimate_tokens(user) + estimate_tokens(bot)
+                    split += 1
+                if split == 0:
+                    return
+                old_turns, summary = self.turns[:split], self.summary
+
+            # Summarize without holding the lock; new turns are only appended
+            new_summary = None
+            method = "extractive"
+            if self.summarize:
+                try:
+                    new_summary = self.summarize(summary, old_turns, self.summary_tokens)
+                    method = "llm"
+                except Exception as e:
+                    print(f"Error summarizing conversation: {str(e)}")
+            if not new_summary:
+                new_summary = extractive_summary(summary, old_turns, self.summary_tokens)
+                method = "extractive"
+
+            with self._lock:
+                self.turns = self.turns[len(old_turns):]
+                self.summary = new_summary
+                self.stats['compactions'] += 1
+                self.stats['summarized_turns'] += len(old_turns)
+                self.stats['tokens_before'] = tokens_before
+                self.stats['tokens_after'] = self.token_count()
+
+            metrics.inc("memory_compactions_total", summary=method)
+            metrics.inc("memory_summarized_turns_total", len(old_turns))
+            metrics.observe("memory_tokens_before_compaction", tokens_before, metrics.TOKEN_BUCKETS)
+            metrics.observe("memory_tokens_after_compaction", self.stats['tokens_after'], metrics.TOKEN_BUCKETS)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def last_user_message(self):
+        """Get the most recent user message kept verbatim, if any"""
+        turns = self.turns
+        return turns[-1][0] if turns else ""
+
+    def build_contents(self, user_input):
+        """Build the Gemini request contents for a new user message"""
+        with self._lock:
+            summary, turns = self.summary, list(self.turns)
+        contents = []
+        if summary:
+            contents.append({"role": "user", "parts": [f"Summary of our conversation so far:\n{summary}"]})
+            contents.append({"role": "model", "parts": ["Thanks, I'll keep that in mind."]})
+        for user, bot in turns:
+            contents.append({"role": "user", "parts": [user]})
+            contents.append({"role": "model", "parts": [bot]})
+        contents.append({"role": "user", "parts": [user_input]})
+        return contents
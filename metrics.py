@@ -0,0 +1,211 @@
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+import streamlit as st
+from pymongo import monitoring
+
+# Set METRICS_ENABLED = false to turn all instrumentation into no-ops
+METRICS_ENABLED = bool(st.secrets.get("METRICS_ENABLED", True))
+
+# Identifies this process's snapshot in the metrics collection
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Histogram bucket upper bounds, for durations (seconds), counts and tokens
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000)
+
+# Metric names are exported with this prefix
+PREFIX = "chatbot_"
+
+class Histogram:
+    """Bucketed distribution of observed values"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# Process-wide metrics keyed by (name, labels), where labels is a sorted tuple of pairs
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+# Callbacks returning {name: value} gauges, read when a snapshot is taken
+_collectors = {}
+
+# Per-thread state of the rerun being timed; Streamlit runs each rerun in one thread
+_local = threading.local()
+
+def inc(name, value=1, **labels):
+    """Add to a counter"""
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record a value in a histogram"""
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+@contextmanager
+def span(stage):
+    """Time a stage of the current rerun"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - started, stage=stage)
+
+def start_rerun(page):
+    """Start timing a script rerun and counting its MongoDB commands"""
+    _local.rerun = (page, time.perf_counter())
+    _local.mongo_commands = 0
+
+def end_rerun():
+    """Record the duration and MongoDB command count of the current rerun"""
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None:
+        return
+    _local.rerun = None
+    page, started = rerun
+    observe("rerun_seconds", time.perf_counter() - started, page=page)
+    observe("rerun_mongo_commands", _local.mongo_commands, COUNT_BUCKETS, page=page)
+
+@contextmanager
+def rerun(page):
+    """Time a whole script rerun, including ones cut short by st.rerun or st.stop"""
+    start_rerun(page)
+    try:
+        yield
+    finally:
+        end_rerun()
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Counts and times MongoDB commands, and attributes them to the current rerun"""
+
+    def started(self, event):
+        if getattr(_local, 'rerun', None) is not None:
+            _local.mongo_commands += 1
+
+    def succeeded(self, event):
+        observe("mongo_command_seconds", event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        observe("mongo_command_seconds", event.duration_micros / 1e6, command=event.command_name)
+        inc("mongo_command_failures_total", command=event.command_name)
+
+def register_collector(name, callback):
+    """Export the numbers returned by callback() as gauges named <name>_<key>"""
+    _collectors[name] = callback
+
+def snapshot():
+    """Copy of this process's metrics, in a form that can be stored in MongoDB"""
+    gauges = []
+    for prefix, callback in list(_collectors.items()):
+        try:
+            values = callback()
+        except Exception as e:
+            print(f"Error collecting {prefix} metrics: {str(e)}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)):
+                gauges.append({'name': f"{prefix}_{key}", 'labels': {}, 'value': value})
+
+    with _lock:
+        return {
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in _counters.items()
+            ],
+            'histograms': [
+                {'name': name, 'labels': dict(labels), 'buckets': list(h.buckets),
+                 'counts': list(h.counts), 'sum': h.sum, 'count': h.count}
+                for (name, labels), h in _histograms.items()
+            ],
+            'gauges': gauges
+        }
+
+def merge_snapshots(snapshots):
+    """Add up snapshots from several processes, keyed by (name, labels)"""
+    merged = {'counters': {}, 'histograms': {}, 'gauges': {}}
+    for snap in snapshots:
+        for kind in ('counters', 'gauges'):
+            for metric in snap.get(kind, []):
+                key = (metric['name'], tuple(sorted(metric['labels'].items())))
+                merged[kind][key] = merged[kind].get(key, 0) + metric['value']
+        for metric in snap.get('histograms', []):
+            key = (metric['name'], tuple(sorted(metric['labels'].items())))
+            current = merged['histograms'].get(key)
+            if current is None or current['buckets'] != metric['buckets']:
+                merged['histograms'][key] = {
+                    'buckets': metric['buckets'], 'counts': list(metric['counts']),
+                    'sum': metric['sum'], 'count': metric['count']
+                }
+            else:
+                current['counts'] = [a + b for a, b in zip(current['counts'], metric['counts'])]
+                current['sum'] += metric['sum']
+                current['count'] += metric['count']
+    return merged
+
+def histogram_quantile(histogram, q):
+    """Upper bound of the bucket holding the q-th quantile of a merged histogram"""
+    if not histogram['count']:
+        return 0.0
+    rank = q * histogram['count']
+    seen = 0
+    for bound, count in zip(list(histogram['buckets']) + [float('inf')], histogram['counts']):
+        seen += count
+        if seen >= rank:
+            return bound
+    return float('inf')
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+def render_prometheus(snapshots):
+    """Render snapshots, added up across processes, in the Prometheus text format"""
+    merged = merge_snapshots(snapshots)
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(merged['counters'].items()):
+        declare(PREFIX + name, "counter")
+        lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value}")
+    for (name, labels), value in sorted(merged['gauges'].items()):
+        declare(PREFIX + name, "gauge")
+        lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value}")
+    for (name, labels), histogram in sorted(merged['histograms'].items()):
+        declare(PREFIX + name, "histogram")
+        cumulative = 0
+        for bound, count in zip(list(histogram['buckets']) + ["+Inf"], histogram['counts']):
+            cumulative += count
+            lines.append(f"{PREFIX}{name}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{PREFIX}{name}_sum{_labels_text(labels)} {histogram['sum']}")
+        lines.append(f"{PREFIX}{name}_count{_labels_text(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
@@ -1,19 +1,97 @@
 import streamlit as st
 import pandas as pd
 from database import (
+    init_database,
     verify_admin,
     verify_admin_session,
+    logout_admin,
     get_chat_history,
+    get_chat_metrics,
+    export_chat_history,
     get_course_data,
     update_course_data,
     get_user_stats,
-    get_course_inquiry_stats
+    get_course_inquiry_stats,
+    get_metrics_snapshots,
+    get_token_usage,
+    get_costliest_chats
 )
+import metrics
+import answer_cache  # Regenerates the sidebar example answers on catalog updates
 import json
+import tempfile
 from datetime import datetime, timedelta
 import streamlit.components.v1 as components
 import plotly.express as px
 import pytz
+from bson import ObjectId
+
+# Number of conversations shown per page in Chat Analytics
+CHAT_PAGE_SIZE = 50
+
+# How long (in seconds) dashboard query results are shared between admins
+# before being fetched again
+USER_STATS_TTL = 60
+COURSE_STATS_TTL = 300
+CHAT_METRICS_TTL = 120
+CHAT_HISTORY_TTL = 30
+METRICS_TTL = 30
+
+# Gemini list prices in USD per million tokens, for cost estimates
+LLM_INPUT_PRICE_PER_M = float(st.secrets.get("LLM_INPUT_PRICE_PER_M", 0.10))
+LLM_OUTPUT_PRICE_PER_M = float(st.secrets.get("LLM_OUTPUT_PRICE_PER_M", 0.40))
+
+# Dashboard queries cached across sessions, keyed by their arguments.
+# Each returns (result, fetched_at) so the page can show the cache age.
+@st.cache_data(ttl=USER_STATS_TTL, show_spinner=False)
+def cached_user_stats():
+    return get_user_stats(), datetime.now()
+
+@st.cache_data(ttl=COURSE_STATS_TTL, show_spinner=False)
+def cached_course_inquiry_stats():
+    return get_course_inquiry_stats(), datetime.now()
+
+@st.cache_data(ttl=CHAT_METRICS_TTL, show_spinner=False)
+def cached_chat_metrics(start_date, end_date):
+    return get_chat_metrics(start_date, end_date), datetime.now()
+
+# The page cursor holds an ObjectId, which Streamlit can't hash by itself
+@st.cache_data(ttl=CHAT_HISTORY_TTL, show_spinner=False, hash_funcs={ObjectId: str})
+def cached_chat_page(start_date, end_date, before):
+    chats = get_chat_history(
+        start_date=start_date,
+        end_date=end_date,
+        fields=['user_message', 'bot_response'],
+        limit=CHAT_PAGE_SIZE,
+        before=before
+    )
+    return chats, datetime.now()
+
+@st.cache_data(ttl=CHAT_METRICS_TTL, show_spinner=False)
+def cached_token_usage(start_date, end_date):
+    return get_token_usage(start_date, end_date), datetime.now()
+
+@st.cache_data(ttl=CHAT_METRICS_TTL, show_spinner=False)
+def cached_costliest_chats(start_date, end_date):
+    return get_costliest_chats(start_date, end_date), datetime.now()
+
+@st.cache_data(ttl=METRICS_TTL, show_spinner=False)
+def cached_metrics_snapshots():
+    return get_metrics_snapshots(), datetime.now()
+
+def clear_dashboard_cache():
+    cached_user_stats.clear()
+    cached_course_inquiry_stats.clear()
+    cached_chat_metrics.clear()
+    cached_chat_page.clear()
+    cached_token_usage.clear()
+    cached_costliest_chats.clear()
+    cached_metrics_snapshots.clear()
+
+def show_cache_age(*fetched_times):
+    fetched_at = min(fetched_times)
+    age = int((datetime.now() - fetched_at).total_seconds())
+    st.caption(f"🕒 Data as of {fetched_at.strftime('%H:%M:%S')} ({age}s ago)")
 
 # Must be the first Streamlit command
 st.set_page_config(
@@ -171,7 +249,7 @@ def show_admin_dashboard():
         st.markdown('<div class="sidebar-header">🎯 Navigation</div>', unsafe_allow_html=True)
         page = st.radio(
             "Navigation Menu",
-            ["Overview", "Chat Analytics", "Course Data Management"],
+            ["Overview", "Chat Analytics", "Course Data Management", "Performance"],
             label_visibility="collapsed"
         )
         st.markdown('</div>', unsafe_allow_html=True)
@@ -179,7 +257,11 @@ def show_admin_dashboard():
         # Admin Actions
         st.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
         st.markdown('<div class="sidebar-header">⚙️ Admin Actions</div>', unsafe_allow_html=True)
+        if st.button("🔄 Refresh Data", key="refresh_btn", help="Fetch fresh data instead of cached results"):
+            clear_dashboard_cache()
+            st.rerun()
         if st.button("🚪 Logout", key="logout_btn"):
+            logout_admin(st.session_state['admin_session_token'])
             st.session_state['admin_session_token'] = None
             st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
@@ -188,13 +270,16 @@ def show_admin_dashboard():
         show_overview()
     elif page == "Chat Analytics":
         show_chat_analytics()
+    elif page == "Performance":
+        show_performance()
     else:
         show_course_management()
 
 def show_overview():
     # Get user statistics
-    user_stats = get_user_stats()
-    course_stats = get_course_inquiry_stats()
+    user_stats, user_stats_time = cached_user_stats()
+    course_stats, course_stats_time = cached_course_inquiry_stats()
+    show_cache_age(user_stats_time, course_stats_time)
     
     # User Statistics Section
     st.markdown("""
@@ -280,6 +365,10 @@ def show_overview():
                     <div class="metric-value">{course_stats['total_inquiries']}</div>
                     <div class="metric-label">📊 Total Course Inquiries</div>
                 </div>
+                <div class="metric-card" style="background-color: #FFF3E0; margin-top: 15px;">
+                    <div class="metric-value">{course_stats['multi_course_messages']}</div>
+                    <div class="metric-label">🔀 Messages About Multiple Courses</div>
+                </div>
             </div>
         """, unsafe_allow_html=True)
         
@@ -340,35 +429,29 @@ def show_overview():
     
     st.markdown("</div></div>", unsafe_allow_html=True)
     
-    # Get chat history
-    chats = get_chat_history()
-    df = pd.DataFrame(chats)
+    # Get chat metrics for the selected range
+    chat_metrics, chat_metrics_time = cached_chat_metrics(start_date, end_date)
     
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['timestamp']).dt.date
-        filtered_df = df[
-            (df['date'] >= start_date) & 
-            (df['date'] <= end_date)
-        ]
-        
+    if chat_metrics['messages']:
         # Chat Metrics
         st.markdown("""
             <div class="section-container">
                 <div class="section-title">💬 Chat Metrics</div>
         """, unsafe_allow_html=True)
+        show_cache_age(chat_metrics_time)
         
-        metrics = [
-            (len(filtered_df['date'].unique()), "📊 Total Sessions", "#E3F2FD"),
-            (len(filtered_df), "💬 Total Messages", "#F3E5F5"),
+        metric_cards = [
+            (chat_metrics['days'], "📊 Total Sessions", "#E3F2FD"),
+            (chat_metrics['messages'], "💬 Total Messages", "#F3E5F5"),
             (9, "⏱️ Average Session Time (Mins)", "#E8F5E9"),
-            (len(filtered_df['user_id'].unique()) if 'user_id' in filtered_df.columns else 0, "👥 Unique Chatters", "#FFF3E0")
+            (chat_metrics['users'], "👥 Unique Chatters", "#FFF3E0")
         ]
         
         # Create two columns for the metrics
         col1, col2 = st.columns(2)
         
         with col1:
-            for value, label, color in metrics[:2]:
+            for value, label, color in metric_cards[:2]:
                 st.markdown(f"""
                     <div class="metric-card" style="background-color: {color};">
                         <div class="metric-value">{value}</div>
@@ -377,7 +460,7 @@ def show_overview():
                 """, unsafe_allow_html=True)
         
         with col2:
-            for value, label, color in metrics[2:]:
+            for value, label, color in metric_cards[2:]:
                 st.markdown(f"""
                     <div class="metric-card" style="background-color: {color};">
                         <div class="metric-value">{value}</div>
@@ -389,6 +472,72 @@ def show_overview():
     else:
         st.info("No chat history available")
 
+    show_token_usage(start_date, end_date)
+
+def token_cost(input_tokens, output_tokens):
+    return (input_tokens * LLM_INPUT_PRICE_PER_M + output_tokens * LLM_OUTPUT_PRICE_PER_M) / 1_000_000
+
+def show_token_usage(start_date, end_date):
+    token_usage, token_usage_time = cached_token_usage(start_date, end_date)
+    days = pd.DataFrame(token_usage['days'])
+    if days.empty:
+        return
+    # Warm-up and summary calls, which aren't part of any chat turn
+    days['background_tokens'] = days['background_input_tokens'] + days['background_output_tokens']
+    if not (days['input_tokens'] + days['output_tokens'] + days['background_tokens']).any():
+        return
+
+    st.markdown("""
+        <div class="section-container">
+            <div class="section-title">🪙 Token Spend</div>
+    """, unsafe_allow_html=True)
+    show_cache_age(token_usage_time)
+
+    input_tokens = int(days['input_tokens'].sum())
+    output_tokens = int(days['output_tokens'].sum())
+    background_input = int(days['background_input_tokens'].sum())
+    background_output = int(days['background_output_tokens'].sum())
+    llm_calls = int(days['llm_calls'].sum())
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Input Tokens", f"{input_tokens + background_input:,}")
+    col2.metric("Output Tokens", f"{output_tokens + background_output:,}")
+    col3.metric("Tokens per Gemini Answer", f"{(input_tokens + output_tokens) // llm_calls:,}" if llm_calls else "–")
+    col4.metric("Estimated Cost (USD)",
+                f"{token_cost(input_tokens + background_input, output_tokens + background_output):.2f}")
+
+    fig = px.bar(
+        days,
+        x='day',
+        y=['input_tokens', 'output_tokens', 'background_tokens'],
+        title='Daily Token Spend',
+        labels={'day': 'Date', 'value': 'Tokens', 'variable': 'Type'}
+    )
+    fig.update_layout(height=400, margin=dict(t=30, b=0, l=0, r=0))
+    st.plotly_chart(fig, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**👤 Heaviest Users**")
+        users = pd.DataFrame(token_usage['top_users'])
+        if not users.empty:
+            users['cost_usd'] = token_cost(users['input_tokens'], users['output_tokens']).round(4)
+            st.dataframe(
+                users.rename(columns={'_id': 'user_id'})[['user_id', 'tokens', 'llm_calls', 'cost_usd']],
+                use_container_width=True,
+                hide_index=True
+            )
+    with col2:
+        st.markdown("**💸 Most Expensive Turns**")
+        chats, _ = cached_costliest_chats(start_date, end_date)
+        if chats:
+            st.dataframe(
+                pd.DataFrame(chats)[['timestamp', 'user_message', 'input_tokens', 'output_tokens', 'llm_latency_ms']],
+                use_container_width=True,
+                hide_index=True
+            )
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
 def show_chat_analytics():
     st.header("Chat Analytics")
     
@@ -416,17 +565,18 @@ def show_chat_analytics():
     
     st.markdown("</div>", unsafe_allow_html=True)
     
-    # Get chat history
-    chats = get_chat_history()
-    df = pd.DataFrame(chats)
+    # Start from the newest page whenever the date range changes
+    if st.session_state.get('analytics_range') != (start_date, end_date):
+        st.session_state['analytics_range'] = (start_date, end_date)
+        st.session_state['analytics_pages'] = [None]  # keyset cursor of each page viewed
+    pages = st.session_state['analytics_pages']
     
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['timestamp']).dt.date
-        filtered_df = df[
-            (df['date'] >= start_date) & 
-            (df['date'] <= end_date)
-        ]
-        
+    # Get one page of chat history
+    chats, chats_time = cached_chat_page(start_date, end_date, pages[-1])
+    
+    if chats:
+        show_cache_age(chats_time)
+
         # Chat history in a more modern table
         st.markdown("""
             <div style="background-color: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
@@ -434,24 +584,43 @@ def show_chat_analytics():
         """, unsafe_allow_html=True)
         
         st.dataframe(
-            filtered_df[['timestamp', 'user_message', 'bot_response']]
-            .sort_values('timestamp', ascending=False)
-            .head(50),
+            pd.DataFrame(chats)[['timestamp', 'user_message', 'bot_response']],
             use_container_width=True
         )
         
+        # Page navigation
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 1, 4])
+        with nav_col1:
+            if len(pages) > 1 and st.button("⬅️ Newer", key="newer-chats"):
+                pages.pop()
+                st.rerun()
+        with nav_col2:
+            if len(chats) == CHAT_PAGE_SIZE and st.button("Older ➡️", key="older-chats"):
+                pages.append({"timestamp": chats[-1]["timestamp"], "_id": chats[-1]["_id"]})
+                st.rerun()
+        
         # Download button with better styling
         st.markdown("""
             <div style="margin-top: 15px;">
         """, unsafe_allow_html=True)
-        csv = filtered_df.to_csv(index=False)
-        st.download_button(
-            "📥 Download Chat History",
-            csv,
-            "chat_history.csv",
-            "text/csv",
-            key='download-csv'
-        )
+        export_format = st.selectbox("Export format", ["CSV", "Parquet"], key="export-format")
+        if st.button("📦 Prepare Download", key="prepare-export"):
+            with st.spinner("Exporting chat history..."):
+                # Rows are streamed from MongoDB into a temporary file in batches
+                export_file = tempfile.TemporaryFile()
+                export_chat_history(export_file, start_date, end_date, export_format.lower())
+                export_file.seek(0)
+            if export_format == "CSV":
+                file_name, mime = "chat_history.csv", "text/csv"
+            else:
+                file_name, mime = "chat_history.parquet", "application/vnd.apache.parquet"
+            st.download_button(
+                "📥 Download Chat History",
+                export_file,
+                file_name,
+                mime,
+                key='download-csv'
+            )
         st.markdown("</div></div>", unsafe_allow_html=True)
         
     else:
@@ -496,7 +665,7 @@ def show_course_management():
             
             # Update the database
             update_course_data(edited_courses)
-            st.success("✅ Course data updated successfully!")
+            st.success("✅ Course data updated successfully! Example answers are being regenerated in the background.")
             
         except json.JSONDecodeError:
             st.error("❌ Invalid JSON format")
@@ -505,7 +674,49 @@ def show_course_management():
     
     st.markdown("</div>", unsafe_allow_html=True)
 
+def show_performance():
+    snapshots, fetched_at = cached_metrics_snapshots()
+    show_cache_age(fetched_at)
+    st.markdown("""
+        <div class="section-container">
+            <div class="section-title">⏱️ Performance</div>
+        </div>
+    """, unsafe_allow_html=True)
+
+    if not snapshots:
+        st.info("No metrics reported yet. Each app process saves its metrics every minute.")
+        return
+    st.caption(f"Aggregated over {len(snapshots)} app process(es) since they started")
+
+    merged = metrics.merge_snapshots(snapshots)
+    rows = []
+    for (name, labels), histogram in sorted(merged['histograms'].items()):
+        if not histogram['count']:
+            continue
+        rows.append({
+            "Metric": name,
+            "Labels": ", ".join(f"{key}={value}" for key, value in labels),
+            "Count": histogram['count'],
+            "Mean": round(histogram['sum'] / histogram['count'], 4),
+            "p50 ≤": metrics.histogram_quantile(histogram, 0.5),
+            "p95 ≤": metrics.histogram_quantile(histogram, 0.95),
+            "p99 ≤": metrics.histogram_quantile(histogram, 0.99)
+        })
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+    counters = [
+        {"Metric": name, "Labels": ", ".join(f"{key}={value}" for key, value in labels), "Value": value}
+        for kind in ('counters', 'gauges')
+        for (name, labels), value in sorted(merged[kind].items())
+    ]
+    st.dataframe(pd.DataFrame(counters), use_container_width=True, hide_index=True)
+
+    with st.expander("Prometheus text format"):
+        st.code(metrics.render_prometheus(snapshots), language="text")
+
 def admin_page():
+    init_database()
+
     # Check for existing session
     if 'admin_session_token' not in st.session_state:
         st.session_state['admin_session_token'] = None
@@ -517,4 +728,5 @@ def admin_page():
         show_admin_dashboard()
 
 if __name__ == "__main__":
-    admin_page()
\ No newline at end of file
+    with metrics.rerun("admin"):
+        admin_page()
\ No newline at end of file
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import Counter
+
+# Extra names students use for courses, on top of any "aliases" list
+# stored with a course in the catalog. Only program names and their
+# abbreviations: generic words like "engineering" also appear in subject
+# names ("Engineering Mechanics") and would count as course mentions.
+COURSE_ALIASES = {
+    "B.Tech": ["btech", "b tech", "bachelor of technology"],
+    "B.Sc": ["bsc", "b sc", "bachelor of science"],
+    "BCA": ["bachelor of computer applications"]
+}
+
+# Name and alias matches count this many times more than other fields
+NAME_WEIGHT = 3
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens"""
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def course_aliases(name, course):
+    """Get all names a course can be referred to by"""
+    aliases = [name, re.sub(r"[^a-z0-9]", "", name.lower())]
+    aliases += COURSE_ALIASES.get(name, [])
+    if isinstance(course, dict):
+        aliases += course.get("aliases", [])
+    return aliases
+
+def _course_tokens(name, course):
+    tokens = []
+    for alias in course_aliases(name, course):
+        tokens += tokenize(alias) * NAME_WEIGHT
+    tokens += tokenize(json.dumps(course, ensure_ascii=False))
+    return tokens
+
+class CourseIndex:
+    """BM25 inverted index over course names, aliases and details"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}  # course name -> (fingerprint, term counts, length)
+        self.postings = {}  # term -> set of course names
+        self.total_length = 0
+
+    def update(self, courses):
+        """Bring the index in line with the catalog, reindexing only changed courses"""
+        for name in list(self.docs):
+            if name not in courses:
+                self._remove(name)
+        for name, course in courses.items():
+            fingerprint = hashlib.sha1(
+                json.dumps(course, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            ).hexdigest()
+            if name in self.docs and self.docs[name][0] == fingerprint:
+                continue
+            self._remove(name)
+            terms = Counter(_course_tokens(name, course))
+            length = sum(terms.values())
+            self.docs[name] = (fingerprint, terms, length)
+            self.total_length += length
+            for term in terms:
+                self.postings.setdefault(term, set()).add(name)
+
+    def copy(self):
+        """Copy the index so it can be updated while the original is still searched"""
+        index = CourseIndex(self.k1, self.b)
+        index.docs = dict(self.docs)
+        index.postings = {term: set(names) for term, names in self.postings.items()}
+        index.total_length = self.total_length
+        return index
+
+    def _remove(self, name):
+        if name not in self.docs:
+            return
+        _, terms, length = self.docs.pop(name)
+        self.total_length -= length
+        for term in terms:
+            self.postings[term].discard(name)
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query, k=3):
+        """Get the names of the top-k courses matching a query"""
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        avg_length = self.total_length / n
+        scores = Counter()
+        for term in set(tokenize(query)):
+            names = self.postings.get(term)
+            if not names:
+                continue
+            idf = math.log(1 + (n - len(names) + 0.5) / (len(names) + 0.5))
+            for name in names:
+                _, terms, length = self.docs[name]
+                tf = terms[term]
+                norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[name] += idf * tf * (self.k1 + 1) / norm
+        return [name for name, _ in scores.most_common(k)]
+
+# Process-wide index as (catalog_version, index). On a catalog change a copy
+# is updated and swapped in whole, so searches never see a half-updated index.
+_index = (None, CourseIndex())
+_index_lock = threading.Lock()
+
+def search_courses(query, catalog_version, courses, k=3):
+    """Get the names of the top-k courses relevant to a query"""
+    global _index
+    version, index = _index
+    if version != catalog_version:
+        with _index_lock:
+            version, index = _index
+            if version != catalog_version:
+                index = index.copy()
+                index.update(courses)
+                _index = (catalog_version, index)
+    return index.search(query, k)
+
+# Course mention matcher: one regex over every name and alias, compiled once
+# per catalog version. Holds (catalog_version, regex, alias -> course name).
+_matcher = (None, None, {})
+_matcher_lock = threading.Lock()
+
+def _course_matcher(catalog_version, courses):
+    global _matcher
+    version, regex, names = _matcher
+    if version != catalog_version:
+        with _matcher_lock:
+            version, regex, names = _matcher
+            if version != catalog_version:
+                names = {}
+                for name, course in courses.items():
+                    for alias in course_aliases(name, course):
+                        names[alias.lower()] = name
+                # Longest aliases first so "bachelor of science" wins over shorter overlaps
+                pattern = "|".join(re.escape(alias) for alias in sorted(names, key=len, reverse=True))
+                regex = re.compile(rf"(?<![\w.])(?:{pattern})(?!\w)") if names else None
+                _matcher = (catalog_version, regex, names)
+    return regex, names
+
+def find_course_mentions(text, catalog_version, courses):
+    """Get every course mentioned in a text, in order of first mention"""
+    regex, names = _course_matcher(catalog_version, courses)
+    if regex is None:
+        return []
+    mentioned = []
+    for match in regex.finditer(text.lower()):
+        name = names[match.group(0)]
+        if name not in mentioned:
+            mentioned.append(name)
+    return mentioned
+
+def strip_course_mentions(text, catalog_version, courses):
+    """Remove every course name and alias from a text"""
+    regex, _ = _course_matcher(catalog_version, courses)
+    text = text.lower()
+    return regex.sub(" ", text) if regex is not None else text